@@ -1,206 +1,10 @@
 #!/usr/bin/env python3
-import os
-import io
-import contextlib
-import pandas as pd
-from datetime import datetime
-from tqdm import tqdm
-from llama_cpp import Llama
+# Single-condition entry point kept for existing job scripts.
+# To run every 7B condition with one model load use:
+#     python3 generation_engine.py --model 7B
+import sys
 
-from profile_generator import (
-    generate_profile,
-    load_occupations,
-    load_interests,
-    load_subreddits,
-    load_nationalities
-)
-
-def main():
-    try:
-        print("Starting main generation pipeline with few-shot learning...")
-
-        # ================================
-        # Load External Profile Data
-        # ================================
-        occupations_data = load_occupations()
-        interests_data = load_interests()
-        subreddits_data = load_subreddits()
-        countries_data = load_nationalities()
-
-        # ================================
-        # Load Few-Shot Examples
-        # ================================
-        few_shot_df = pd.read_csv("sampled_1000_rows.csv")
-        few_shot_texts = few_shot_df["text"].dropna().tolist()
-
-        # ================================
-        # Model Initialization
-        # ================================
-        model_path = os.path.expanduser(
-            './models/Mistral-7B-Instruct-v0.2.Q4_K_M.gguf'
-        )
-
-        # llm = Llama(
-        #     model_path=model_path,
-        #     n_ctx=2048,
-        #     n_threads=8,
-        #     verbose=False
-        # )
-
-        
-        llm = Llama(
-            model_path=model_path,
-            n_ctx=2048,
-            n_threads=48,
-            n_gpu_layers=35,
-            verbose=False
-        )
-        # ================================
-        # Generation Settings
-        # ================================
-        total_posts = 5400
-        condition = "MDD"
-
-        data_prompt_template = """
-Now independently imagine yourself as a normal reddit user and write exactly one reddit comment that would 
-fit in the subreddit r/{sub_choice}. Your comment must be approximately 80 words long. Exclude hashtags from your response. 
-Do not use titles. Exclude preambles. Don't make explicit references to MDD and keep it implicit. You must avoid using any 
-language related to mental health such as a condition or general terms like “depression”, “mania”, “mental illness”,“diagnosed with”, or “suffering from”.  
-Have a creative start to your response and be creative throughout the response. Focus on general behavior, expression, and tone.
-"""
-
-        diversity_prompt = """
-Make this comment more diverse than the previous posts. Change the structure at the beginning and throughout your response: 
-it shouldn't follow the format of your previous posts.
-"""
-
-        gen_config = {
-            "max_tokens": 200,
-            "temperature": 0.8,
-            "top_p": 0.95,
-            "top_k": 40,
-            "repeat_penalty": 1.1,
-            "presence_penalty": 0.0,
-            "frequency_penalty": 0.0,
-            "stop": ["</s>"]
-        }
-
-        # ================================
-        # Generate Prompts
-        # ================================
-        prompts = []
-
-        for i in range(1, total_posts + 1):
-            profile = generate_profile(
-                occupations=occupations_data,
-                interests=interests_data,
-                subreddits=subreddits_data,
-                countries=countries_data
-            )
-
-            profile["condition"] = condition
-            sub_choice = profile["subreddit"]
-            data_prompt = data_prompt_template.format(sub_choice=sub_choice)
-
-            if i % 5 == 0:
-                body = f"{data_prompt}\n\n{diversity_prompt}"
-                ptype = "diversity"
-            else:
-                body = data_prompt
-                ptype = "normal"
-
-            # Sample few-shot examples (change 10 to desired count)
-            sampled_examples = pd.Series(few_shot_texts).sample(n=10, random_state=i).tolist()
-            few_shot_block = "\n\n".join(f"- {ex}" for ex in sampled_examples)
-
-            persona_line = (
-                f"Your age is: {profile['age']}. You are a {profile['gender']}. "
-                f"Your occupation is: {profile['occupation']}. "
-                f"Your interests are: {', '.join(profile['interests'])}. "
-                f"You are diagnosed with the condition: {profile['condition']}."
-            )
-
-            full_prompt = (
-                f"[INST] {persona_line}\n\n"
-                f"Here are some example comments:\n{few_shot_block}\n\n"
-                f"Do not copy or repeat any example comments verbatim. Use them as inspiration to mimic tone, structure, or style.\n\n"
-                f"{body} [/INST]"
-            )
-
-            prompts.append({
-                "index": i,
-                "type": ptype,
-                "prompt": full_prompt,
-                "persona_line": persona_line,
-                "profile": profile
-            })
-
-        # ================================
-        # Run Model Inference
-        # ================================
-        results = []
-        start = datetime.now()
-
-        for idx, entry in enumerate(tqdm(prompts, desc="Generating comments"), start=1):
-            buf = io.StringIO()
-            try:
-                with contextlib.redirect_stdout(buf):
-                    out = llm(
-                        entry["prompt"],
-                        max_tokens=gen_config["max_tokens"],
-                        temperature=gen_config["temperature"],
-                        top_p=gen_config["top_p"],
-                        top_k=gen_config["top_k"],
-                        repeat_penalty=gen_config["repeat_penalty"],
-                        presence_penalty=gen_config["presence_penalty"],
-                        frequency_penalty=gen_config["frequency_penalty"],
-                        stop=gen_config["stop"]
-                    )
-                text = out["choices"][0]["text"].strip()
-            except Exception as e:
-                text = f"[Error: {e}]"
-
-            profile = entry["profile"]
-
-            results.append({
-                "TID": idx,
-                "Age": profile["age"],
-                "Gender": profile["gender"],
-                "Education": profile["education"],
-                "Occupation": profile["occupation"],
-                "Interests": ', '.join(profile["interests"]),
-                "Subreddit": profile["subreddit"],
-                "Nationality": profile["nationality"],
-                "Marrital Status": profile["marital_status"],
-                "Condition": profile["condition"],
-                "Persona": entry["persona_line"],
-                "Prompt": entry["prompt"],
-                "Generated Text": text,
-                "max_tokens": gen_config["max_tokens"],
-                "temperature": gen_config["temperature"],
-                "top_p": gen_config["top_p"],
-                "top_k": gen_config["top_k"],
-                "repeat_penalty": gen_config["repeat_penalty"],
-                "presence_penalty": gen_config["presence_penalty"],
-                "frequency_penalty": gen_config["frequency_penalty"],
-                "stop": str(gen_config["stop"]),
-                "model": os.path.basename(model_path)
-            })
-
-        end = datetime.now()
-        print(f"\nDone in {end - start}")
-
-        # ================================
-        # Save Output to CSV
-        # ================================
-        df = pd.DataFrame(results)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        outfn = f"mdd_atb_few_7B.csv"
-        df.to_csv(outfn, index=False)
-        print(f"Saved {len(df)} rows to {outfn}")
-
-    except Exception as e:
-        print(f"Error in main: {e}")
+from generation_engine import main
 
 if __name__ == "__main__":
-    main()
+    main(["--model", "7B", "--conditions", "mdd_atb_few"] + sys.argv[1:])
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import os
+import random
+import argparse
+import itertools
+import numpy as np
+import llama_cpp
+
+from batched_decoding import DEFAULT_N_BATCH
+from generation_engine import (
+    GEN_CONFIG,
+    LLAMA_DEFAULTS,
+    MODELS,
+    build_packer,
+    generate,
+    iter_prompts,
+    load_model,
+    load_resources,
+    select_conditions,
+)
+from hardware_profile import TUNING_DIR, available_cpus, host_name, save_profile
+
+BATCH_SIZES = [(512, 512), (256, 256), (1024, 512), (1024, 1024), (128, 128)]
+
+
+# ================================
+# Candidates
+# ================================
+def thread_candidates(cpus):
+    counts = {cpus, cpus * 3 // 4, cpus // 2, cpus // 4, 1}
+    return sorted((n for n in counts if n >= 1), reverse=True)
+
+
+def offload_candidates(model_size):
+    """GPU layer counts to try; CPU-only builds of llama.cpp can only run 0."""
+    if not llama_cpp.llama_supports_gpu_offload():
+        return [0]
+    configured = MODELS[model_size]["n_gpu_layers"]
+    return sorted({0, configured // 2, configured, -1})
+
+
+def sample_prompts(model_size, conditions, n_prompts, seed=0, model_path=None):
+    """
+    Prompts drawn round-robin from the selected conditions, so the mix
+    matches a real run. Few-shot examples are packed into the model entry's
+    context as generation_engine.py packs them, using the GGUF's vocabulary.
+    """
+    conds = select_conditions(model_size, conditions)
+    resources = load_resources(conds)
+    vocab = None
+    if any(cond["shot"] == "few" for cond in conds):
+        overrides = {"model_path": model_path} if model_path else {}
+        # Only the tokenizer is used, so the context stays at one batch
+        vocab = load_model(model_size, tuning_dir=None, vocab_only=True, n_ctx=DEFAULT_N_BATCH, **overrides)
+        n_ctx = MODELS[model_size].get("n_ctx", LLAMA_DEFAULTS["n_ctx"])
+        resources["few_shot_packer"] = build_packer(vocab, None, resources, GEN_CONFIG,
+                                                    prompt_budget=n_ctx - GEN_CONFIG["max_tokens"] - 1)
+    streams = [iter_prompts(cond, resources, seed) for cond in conds]
+    prompts = []
+    for stream in itertools.cycle(streams):
+        if len(prompts) >= n_prompts:
+            break
+        prompts.append(next(stream))
+    if vocab is not None:
+        vocab.close()
+    return prompts
+
+
+# ================================
+# Benchmark
+# ================================
+def measure(llm, prompts, n_decode):
+    """
+    Time the prompt mix with a clean KV cache for each prompt. ms_per_row
+    scales the measured decode speed up to GEN_CONFIG's max_tokens.
+    """
+    gen_config = dict(GEN_CONFIG, max_tokens=n_decode)
+    llm.reset()
+    generate(llm, prompts[0]["prompt"], gen_config, seed=0)
+
+    prompt_ms, prompt_tokens, decode_ms, decode_tokens = 0.0, 0, 0.0, 0
+    for entry in prompts:
+        llm.reset()
+        _, metrics = generate(llm, entry["prompt"], gen_config, seed=entry["seed"])
+        if metrics["finish_reason"] == "error":
+            raise RuntimeError(f"Benchmark prompt {entry['index']} failed")
+        prompt_ms += metrics["prompt_eval_ms"]
+        prompt_tokens += metrics["prompt_tokens_evaluated"]
+        decode_ms += metrics["decode_ms"]
+        decode_tokens += metrics["completion_tokens"]
+
+    ms_per_token = decode_ms / max(decode_tokens, 1)
+    return {
+        "ms_per_row": prompt_ms / len(prompts) + ms_per_token * GEN_CONFIG["max_tokens"],
+        "prompt_tok_s": prompt_tokens / (prompt_ms / 1000.0) if prompt_ms else None,
+        "decode_tok_s": 1000.0 / ms_per_token if decode_tokens else None,
+    }
+
+
+class Tuner:
+    """
+    Coordinate search: offload first, then n_threads and n_threads_batch on
+    the loaded model, then n_batch/n_ubatch. Thread counts are changed in
+    place with llama_set_n_threads; the other settings need a reload, which
+    is cheap after the first because the GGUF is memory-mapped.
+    """
+
+    def __init__(self, model_size, model_path, prompts, n_decode):
+        self.model_size = model_size
+        self.model_path = model_path
+        self.prompts = prompts
+        self.n_decode = n_decode
+        self.results = []
+        self.llm = None
+        self.llm_params = None
+
+    def _load(self, params):
+        load_keys = ("n_gpu_layers", "n_batch", "n_ubatch")
+        wanted = {key: params[key] for key in load_keys}
+        if self.llm is not None and wanted == self.llm_params:
+            return self.llm
+        if self.llm is not None:
+            self.llm.close()
+            self.llm = None
+        self.llm = load_model(self.model_size, tuning_dir=None, model_path=self.model_path, **params)
+        self.llm_params = wanted
+        return self.llm
+
+    def run(self, params):
+        try:
+            llm = self._load(params)
+            llama_cpp.llama_set_n_threads(llm._ctx.ctx, params["n_threads"], params["n_threads_batch"])
+            result = measure(llm, self.prompts, self.n_decode)
+        except Exception as e:
+            print(f"  {params} failed: {e}")
+            return None
+        result = dict(params, **result)
+        self.results.append(result)
+        print(f"  {params}: {result['ms_per_row']:.0f} ms/row "
+              f"(prompt {result['prompt_tok_s'] or 0:.0f} tok/s, decode {result['decode_tok_s'] or 0:.1f} tok/s)")
+        return result["ms_per_row"]
+
+    def search(self, params, key, values):
+        """Try each value for one parameter (pairs of keys allowed) and keep the fastest."""
+        best, best_ms = None, np.inf
+        for value in values:
+            trial = dict(params)
+            if isinstance(key, tuple):
+                trial.update(zip(key, value))
+            else:
+                trial[key] = value
+            ms = self.run(trial)
+            if ms is not None and ms < best_ms:
+                best, best_ms = trial, ms
+        if best is None:
+            raise RuntimeError(f"Every setting of {key} failed")
+        return best
+
+    def tune(self, cpus):
+        n_ctx = LLAMA_DEFAULTS["n_ctx"]
+        params = {
+            "n_threads": cpus,
+            "n_threads_batch": cpus,
+            "n_batch": 512,
+            "n_ubatch": 512,
+            "n_gpu_layers": offload_candidates(self.model_size)[-1],
+        }
+        print("Offload:")
+        params = self.search(params, "n_gpu_layers", offload_candidates(self.model_size))
+        print("Threads:")
+        params = self.search(params, "n_threads", thread_candidates(cpus))
+        print("Batch threads:")
+        params = self.search(params, "n_threads_batch", thread_candidates(cpus))
+        print("Batch sizes:")
+        sizes = [(nb, nu) for nb, nu in BATCH_SIZES if nb <= n_ctx]
+        params = self.search(params, ("n_batch", "n_ubatch"), sizes)
+        if self.llm is not None:
+            self.llm.close()
+        return params
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark Llama thread, batch and offload settings on this host and cache the fastest."
+    )
+    parser.add_argument("--model", choices=sorted(MODELS), required=True)
+    parser.add_argument("--model-path", default=None, help="Override the GGUF path for --model")
+    parser.add_argument("--conditions", nargs="+", default=None,
+                        help="Conditions whose prompts make up the benchmark mix (default: all)")
+    parser.add_argument("--prompts", type=int, default=8, help="Prompts timed per setting")
+    parser.add_argument("--decode-tokens", type=int, default=32, help="Tokens generated per timed prompt")
+    parser.add_argument("--tuning-dir", default=TUNING_DIR)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    model_path = os.path.expanduser(args.model_path or MODELS[args.model]["model_path"])
+    cpus = available_cpus()
+    print(f"Tuning {os.path.basename(model_path)} on {host_name()} with {cpus} CPU(s)")
+
+    random.seed(0)
+    prompts = sample_prompts(args.model, args.conditions, args.prompts, model_path=model_path)
+    tuner = Tuner(args.model, model_path, prompts, args.decode_tokens)
+    params = tuner.tune(cpus)
+
+    path = save_profile(model_path, params, tuner.results, tuning_dir=args.tuning_dir)
+    print(f"Best: {params}")
+    print(f"Saved profile to {path}; generation_engine.py picks it up for this model on this host")
+
+
+if __name__ == "__main__":
+    main()
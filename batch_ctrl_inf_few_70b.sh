@@ -61,4 +61,13 @@ source $HOME/myvenv2/bin/activate
 #srun python3 Attribute-Controlled_zeroshot_70B.py 
 #srun python3 Attribute-Controlled_fewshot_70B.py
 #srun python3 Attribute-Controlled_fewshot_7B.py
-srun python3 ctrl_Rong_inferred_fewshot_70B.py
\ No newline at end of file
+#srun python3 ctrl_Rong_inferred_fewshot_70B.py
+
+# Load the 70B model once and run all eight conditions against it.
+# Restrict with e.g. --conditions ctrl_inf_few mdd_inf_few
+srun python3 generation_engine.py --model 70B
+
+# Sharded alternative: add "#SBATCH --array=0-7" to the flags above. Each array
+# task then generates its slice of TIDs (shard = SLURM_ARRAY_TASK_ID, seed =
+# SLURM_ARRAY_JOB_ID) into <output>.shard-XXX-of-008.csv. Once all tasks finish:
+#   python3 merge_shards.py --model 70B
@@ -61,4 +61,12 @@ source $HOME/myvenv2/bin/activate
 #srun python3 Attribute-Controlled_zeroshot_70B.py 
 #srun python3 Attribute-Controlled_fewshot_70B.py
 #srun python3 Attribute-Controlled_fewshot_7B.py
-srun python3 ctrl_Rong_inferred_zeroshot_7B.py
\ No newline at end of file
+#srun python3 ctrl_Rong_inferred_zeroshot_7B.py
+
+# Optional, once per node type: benchmark thread/batch/offload settings for the 24
+# allocated cores; the engine then loads the cached profile automatically.
+#srun python3 autotune.py --model 7B
+
+# Load the 7B model once and run all eight conditions against it.
+# Restrict with e.g. --conditions ctrl_inf_few mdd_inf_few
+srun python3 generation_engine.py --model 7B
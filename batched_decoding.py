@@ -0,0 +1,320 @@
+import time
+import numpy as np
+import llama_cpp
+from llama_cpp import _internals
+
+from constrained_decoding import banned_terms_processor
+from early_stopping import word_budget_cut
+
+# llama.cpp's default penalty window and min-p, as used by Llama.__call__
+PENALTY_LAST_N = 64
+DEFAULT_MIN_P = 0.05
+# Tokens per llama_decode call; also all the model's own context needs when
+# only the batcher decodes on it
+DEFAULT_N_BATCH = 512
+
+
+def _softmax(x):
+    e = np.exp(x - x.max())
+    return e / e.sum()
+
+
+def sample_token(logits, history, gen_config, rng):
+    """
+    Sample one token with the same chain llama.cpp applies for Llama.__call__:
+    penalties -> top-k -> top-p -> min-p -> temperature. `history` holds the
+    tokens sampled so far; like Llama.__call__, prompt tokens are never
+    penalized.
+    """
+    logits = np.array(logits, dtype=np.float64)
+
+    if history:
+        recent = np.asarray(history[-PENALTY_LAST_N:], dtype=np.int64)
+        uniq, counts = np.unique(recent, return_counts=True)
+        vals = logits[uniq]
+        rp = gen_config["repeat_penalty"]
+        vals = np.where(vals > 0, vals / rp, vals * rp)
+        vals -= counts * gen_config["frequency_penalty"] + gen_config["presence_penalty"]
+        logits[uniq] = vals
+
+    if gen_config["temperature"] <= 0:
+        return int(np.argmax(logits))
+
+    top_k = gen_config["top_k"]
+    if 0 < top_k < logits.shape[0]:
+        idx = np.argpartition(logits, -top_k)[-top_k:]
+    else:
+        idx = np.arange(logits.shape[0])
+    order = np.argsort(logits[idx])[::-1]
+    idx = idx[order]
+    cand = logits[idx]
+
+    probs = _softmax(cand)
+    keep = int(np.searchsorted(np.cumsum(probs), gen_config["top_p"])) + 1
+    min_p = gen_config.get("min_p", DEFAULT_MIN_P)
+    keep = max(1, min(keep, int((probs >= probs[0] * min_p).sum())))
+    idx, cand = idx[:keep], cand[:keep]
+
+    probs = _softmax(cand / gen_config["temperature"])
+    return int(idx[rng.choice(keep, p=probs)])
+
+
+class _Slot:
+    def __init__(self, seq_id):
+        self.seq_id = seq_id
+        self.entry = None
+
+    def start(self, entry, prompt_tokens, rng, fork_from=None):
+        self.entry = entry
+        self.prompt_tokens = prompt_tokens
+        # Slot (and its entry) whose evaluated prompt this one will copy
+        self.fork_from = fork_from
+        self.fork_entry = None if fork_from is None else fork_from.entry
+        self.n_prompt_done = 0
+        # Prompt tokens this slot evaluates itself: 1 after a fork
+        self.n_prompt_eval = len(prompt_tokens)
+        self.n_past = 0
+        self.completion = []
+        self.rng = rng
+        self.t_start = self.t_prompt = time.perf_counter()
+        self.t_first = None
+
+    @property
+    def free(self):
+        return self.entry is None
+
+    @property
+    def prefilling(self):
+        return self.n_prompt_done < len(self.prompt_tokens)
+
+
+class BatchedGenerator:
+    """
+    Continuous batching over one llama.cpp context: up to `n_parallel`
+    sequences share every llama_decode call, and a finished sequence's slot
+    is refilled from the prompt queue on the next step.
+
+    The context is created on the already loaded model, so no weights are
+    reloaded. Each sequence gets `n_ctx_per_seq` tokens of KV cache; `resize`
+    swaps in a context with another split of the KV cache between runs.
+
+    A prompt that is already in another slot (several samples of one
+    prompt) is not evaluated again: once the first copy is prefilled its KV
+    cells are shared with the new sequence, which only evaluates the last
+    prompt token to get its own logits.
+    """
+
+    def __init__(self, llm, n_parallel=8, n_ctx_per_seq=None, n_batch=DEFAULT_N_BATCH, seed=None):
+        self.llm = llm
+        self.seed = seed
+        self._n_batch = n_batch
+        self._ctx = None
+        self.resize(n_ctx_per_seq or llm.n_ctx(), n_parallel)
+        # The configured split bounds what later resizes may use
+        self.max_ctx_per_seq = self.n_ctx_per_seq
+        self.kv_tokens = self.n_ctx_per_seq * self.n_parallel
+        self._n_vocab = llm.n_vocab()
+
+        self.forks = 0
+
+        self._eog = {llm.token_eos()}
+        eot = llm._model.token_eot()
+        if eot >= 0:
+            self._eog.add(eot)
+
+    def resize(self, n_ctx_per_seq, n_parallel):
+        """Replace the context with one of n_parallel sequences of n_ctx_per_seq tokens each."""
+        if self._ctx is not None:
+            if (n_ctx_per_seq, n_parallel) == (self.n_ctx_per_seq, self.n_parallel):
+                return
+            self._ctx.close()
+            self._batch.close()
+        self.n_ctx_per_seq = n_ctx_per_seq
+        self.n_parallel = n_parallel
+        self.n_batch = max(self._n_batch, n_parallel)
+
+        params = llama_cpp.llama_context_params.from_buffer_copy(self.llm.context_params)
+        params.n_ctx = n_ctx_per_seq * n_parallel
+        params.n_batch = self.n_batch
+        params.n_ubatch = min(params.n_ubatch, self.n_batch)
+        params.n_seq_max = n_parallel
+        self._ctx = _internals.LlamaContext(model=self.llm._model, params=params, verbose=self.llm.verbose)
+        self._batch = _internals.LlamaBatch(n_tokens=self.n_batch, embd=0, n_seq_max=n_parallel)
+
+    def _rng(self, entry):
+        if entry.get("seed") is not None:
+            return np.random.default_rng(entry["seed"])
+        if self.seed is None:
+            return np.random.default_rng()
+        return np.random.default_rng([self.seed, entry["index"]])
+
+    def _result(self, slot, finish_reason, text=None):
+        if text is None:
+            text = self.llm.detokenize(slot.completion).decode("utf-8", errors="ignore")
+        # Wall-clock times per sequence; decode steps are shared with the
+        # other sequences in the batch. A forked sample counts only the
+        # prompt token it evaluated, timed from the fork.
+        t_end = time.perf_counter()
+        return slot.entry, {
+            "choices": [{"text": text, "index": 0, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": len(slot.prompt_tokens),
+                "completion_tokens": len(slot.completion),
+                "total_tokens": len(slot.prompt_tokens) + len(slot.completion),
+            },
+            "timings": {
+                "prompt_n": slot.n_prompt_eval,
+                "prompt_ms": (slot.t_first - slot.t_prompt) * 1000.0,
+                "predicted_n": len(slot.completion),
+                "predicted_ms": (t_end - slot.t_first) * 1000.0,
+            },
+            "latency_ms": (t_end - slot.t_start) * 1000.0,
+        }
+
+    def _donor(self, entry):
+        for slot in self._slots:
+            if not slot.free and slot.fork_from is None and slot.entry["prompt"] == entry["prompt"]:
+                return slot
+        return None
+
+    def _fork(self, slot):
+        """Copy the donor's prompt cells into the slot; False while the donor is still prefilling."""
+        donor = slot.fork_from
+        if donor.entry is not slot.fork_entry:
+            # The donor finished and its cells are gone: evaluate the prompt after all
+            slot.fork_from = None
+            slot.t_prompt = time.perf_counter()
+            return True
+        if donor.prefilling:
+            return False
+        # Sequences have their own KV streams unless the context is unified,
+        # and those can only be copied whole: copy everything, then drop the
+        # donor's last prompt token and what it has generated since
+        n = len(slot.prompt_tokens) - 1
+        self._ctx.kv_cache_seq_cp(donor.seq_id, slot.seq_id, -1, -1)
+        self._ctx.kv_cache_seq_rm(slot.seq_id, n, -1)
+        slot.n_prompt_done = slot.n_past = n
+        slot.n_prompt_eval = len(slot.prompt_tokens) - n
+        slot.t_prompt = time.perf_counter()
+        slot.fork_from = None
+        self.forks += 1
+        return True
+
+    def _release(self, slot):
+        self._ctx.kv_cache_seq_rm(slot.seq_id, -1, -1)
+        slot.entry = None
+
+    def _check_stop(self, slot, gen_config):
+        """Return (finish_reason, text) once the slot's sequence is finished."""
+        if slot.completion[-1] in self._eog:
+            slot.completion.pop()
+            return "stop", None
+        text = self.llm.detokenize(slot.completion).decode("utf-8", errors="ignore")
+        for stop in gen_config["stop"]:
+            pos = text.find(stop)
+            if pos != -1:
+                return "stop", text[:pos]
+        if gen_config.get("word_budget"):
+            cut = word_budget_cut(text, gen_config["word_budget"])
+            if cut is not None:
+                return "word_budget", text[:cut]
+        if len(slot.completion) >= gen_config["max_tokens"]:
+            return "length", text
+        if slot.n_past >= self.n_ctx_per_seq:
+            return "length", text
+        return None, None
+
+    def generate(self, entries, gen_config):
+        """
+        Yield (entry, completion) pairs in completion order for an iterable of
+        prompt entries. Completions follow the Llama.__call__ response layout.
+        Banned terms apply as in the sequential path; grammars do not.
+        """
+        if gen_config.get("grammar"):
+            raise ValueError("Grammar-constrained sampling is not supported with batched decoding")
+        processor = banned_terms_processor(self.llm, gen_config)
+        queue = iter(entries)
+        slots = self._slots = [_Slot(seq_id) for seq_id in range(self.n_parallel)]
+        exhausted = False
+
+        while True:
+            # Refill free slots from the prompt queue
+            for slot in slots:
+                while slot.free and not exhausted:
+                    entry = next(queue, None)
+                    if entry is None:
+                        exhausted = True
+                        break
+                    donor = self._donor(entry)
+                    if donor is not None:
+                        slot.start(entry, donor.prompt_tokens, self._rng(entry), fork_from=donor)
+                        continue
+                    if entry.get("prompt_tokens") is not None:
+                        tokens = entry["prompt_tokens"].tolist()
+                    else:
+                        tokens = self.llm.tokenize(entry["prompt"].encode("utf-8"), add_bos=True, special=True)
+                    if len(tokens) >= self.n_ctx_per_seq:
+                        yield entry, {"error": (
+                            f"Requested tokens ({len(tokens)}) exceed context window of {self.n_ctx_per_seq}"
+                        )}
+                        continue
+                    slot.start(entry, tokens, self._rng(entry))
+
+            if not any(not s.free for s in slots):
+                return
+            active = [s for s in slots if not s.free and (s.fork_from is None or self._fork(s))]
+
+            # One decode step: every generating sequence contributes its last
+            # token, prefilling sequences fill the remaining batch capacity.
+            self._batch.reset()
+            logit_rows = {}
+            for slot in active:
+                if not slot.prefilling:
+                    logit_rows[slot.seq_id] = self._add(slot, [slot.completion[-1]], logits_last=True)
+            for slot in active:
+                if slot.prefilling:
+                    room = self.n_batch - self._batch.n_tokens()
+                    if room <= 0:
+                        break
+                    chunk = slot.prompt_tokens[slot.n_prompt_done:slot.n_prompt_done + room]
+                    last = slot.n_prompt_done + len(chunk) == len(slot.prompt_tokens)
+                    row = self._add(slot, chunk, logits_last=last)
+                    slot.n_prompt_done += len(chunk)
+                    if last:
+                        logit_rows[slot.seq_id] = row
+
+            self._ctx.decode(self._batch)
+
+            for slot in active:
+                row = logit_rows.get(slot.seq_id)
+                if row is None:
+                    continue
+                logits = np.ctypeslib.as_array(self._ctx.get_logits_ith(row), shape=(self._n_vocab,))
+                if slot.t_first is None:
+                    slot.t_first = time.perf_counter()
+                if processor is not None:
+                    # The prompt's end decides whether the completion starts a word
+                    logits = processor(slot.prompt_tokens[-PENALTY_LAST_N:] + slot.completion, np.array(logits))
+                token = sample_token(logits, slot.completion, gen_config, slot.rng)
+                slot.completion.append(token)
+
+                finish_reason, text = self._check_stop(slot, gen_config)
+                if finish_reason is not None:
+                    result = self._result(slot, finish_reason, text)
+                    self._release(slot)
+                    yield result
+
+    def _add(self, slot, tokens, logits_last):
+        """Append tokens for one sequence to the batch; return the row of its last token."""
+        batch = self._batch.batch
+        for token in tokens:
+            j = batch.n_tokens
+            batch.token[j] = token
+            batch.pos[j] = slot.n_past
+            batch.n_seq_id[j] = 1
+            batch.seq_id[j][0] = slot.seq_id
+            batch.logits[j] = False
+            batch.n_tokens += 1
+            slot.n_past += 1
+        batch.logits[batch.n_tokens - 1] = logits_last
+        return batch.n_tokens - 1
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from mock_llama import WORDS, MockLlama
+
+SIZES = (1000, 10000, 100000)
+RESULT_COLUMNS = [
+    "model", "condition", "prompts", "rows", "setup_s", "wall_s", "us_per_row", "rows_per_sec",
+    "peak_rss_mb", "output_mb",
+]
+
+
+# ================================
+# Inputs
+# ================================
+def _text(rng, n_words):
+    return " ".join(rng.choices(WORDS, k=n_words))
+
+
+def synthetic_resources(conditions, n_prompts, seed=0):
+    """In-memory stand-ins for the persona, profile and few-shot files, sized like the real ones."""
+    from profile_generator import education_levels
+
+    rng = random.Random(seed)
+    resources = {}
+    if any(c["persona_type"] == "attribute_controlled" for c in conditions):
+        resources["profile_data"] = {
+            "occupations": [
+                {"name": f"Occupation {i}", "min_age": rng.choice((16, 18, 22, 25)),
+                 "min_education": rng.choice(education_levels)}
+                for i in range(400)
+            ],
+            "interests": [f"interest {i}" for i in range(60)],
+            "subreddits": [f"subreddit{i}" for i in range(100)],
+            "countries": ["USA", "UK", "Canada", "Australia", "Germany", "India"] + [f"Country {i}" for i in range(60)],
+        }
+    if any(c["shot"] == "few" for c in conditions):
+        texts = [_text(rng, rng.randint(20, 250)) for _ in range(1000)]
+        resources["few_shot_texts"] = np.array(texts, dtype=object)
+        resources["few_shot_ids"] = np.arange(len(texts))
+    groups = {c["group"] for c in conditions if c["persona_type"] == "inferred"}
+    if groups:
+        resources["personas"] = {group: pd.Series([_text(rng, 60) for _ in range(n_prompts)]) for group in groups}
+    return resources
+
+
+def file_resources(conditions, n_prompts):
+    """The real input files, with the inferred personas repeated or cut to n_prompts."""
+    from generation_engine import load_resources
+
+    resources = load_resources(conditions)
+    for group, personas in resources.get("personas", {}).items():
+        resources["personas"][group] = personas.iloc[np.arange(n_prompts) % len(personas)]
+    return resources
+
+
+# ================================
+# One configuration per process
+# ================================
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def run_config(model_size, cond_name, n_prompts, options):
+    """Run one condition end to end against a MockLlama in this process and time it."""
+    import generation_engine as engine
+
+    engine.ATTRIBUTE_TOTAL_POSTS = n_prompts
+    cond = engine.select_conditions(model_size, [cond_name])[0]
+    gen_config = dict(engine.GEN_CONFIG, word_budget=options["word_budget"])
+
+    setup_start = time.perf_counter()
+    if options["data"] == "files":
+        resources = file_resources([cond], n_prompts)
+    else:
+        resources = synthetic_resources([cond], n_prompts, seed=options["seed"])
+    llm = MockLlama(
+        model_path=engine.MODELS[model_size]["model_path"],
+        n_ctx=engine.LLAMA_DEFAULTS["n_ctx"],
+        latency=options["latency"],
+        decode_tokens_per_sec=options["decode_tps"],
+    )
+    with tempfile.TemporaryDirectory() as output_dir, \
+            contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        if cond["shot"] == "few" and not options["no_packing"]:
+            resources["few_shot_packer"] = engine.build_packer(llm, None, resources, gen_config)
+        setup_s = time.perf_counter() - setup_start
+
+        started = time.perf_counter()
+        outfn = engine.run_condition(llm, cond, resources, llm.model_path, gen_config=gen_config,
+                                     output_dir=output_dir, seed=options["seed"],
+                                     output_format=options["output_format"], pipeline=options["pipeline"])
+        wall_s = time.perf_counter() - started
+        rows = llm.calls
+        output_mb = os.path.getsize(outfn) / (1 << 20)
+
+    # Time the mock spent sleeping stands for the model, not overhead
+    overhead_s = max(wall_s - llm.slept, 0.0)
+    return {
+        "model": model_size,
+        "condition": cond_name,
+        "prompts": n_prompts,
+        "rows": rows,
+        "setup_s": setup_s,
+        "wall_s": wall_s,
+        "us_per_row": 1e6 * overhead_s / rows if rows else None,
+        "rows_per_sec": rows / wall_s if wall_s else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "output_mb": output_mb,
+    }
+
+
+def run_isolated(func, *args):
+    """
+    func(*args) in a fresh interpreter, so peak memory belongs to this
+    configuration alone. A crash of that interpreter raises BrokenProcessPool.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(func, *args).result()
+
+
+# ================================
+# Report
+# ================================
+def compare(results, baseline_path):
+    """Per-row overhead against an earlier results CSV, as a ratio (>1: slower now)."""
+    baseline = pd.read_csv(baseline_path)
+    merged = results.merge(baseline, on=["model", "condition", "prompts"], suffixes=("", "_baseline"))
+    merged["overhead_ratio"] = merged["us_per_row"] / merged["us_per_row_baseline"]
+    return merged[["model", "condition", "prompts", "us_per_row_baseline", "us_per_row", "overhead_ratio"]]
+
+
+def parse_args(argv=None):
+    from generation_engine import MODELS, OUTPUT_FORMATS, condition_matrix
+
+    parser = argparse.ArgumentParser(
+        description="Time the generation pipeline around the model (prompt building, few-shot sampling, row "
+                    "writing) for every model x condition, with a mock model in place of llama.cpp."
+    )
+    parser.add_argument("--models", nargs="+", choices=sorted(MODELS), default=sorted(MODELS))
+    parser.add_argument("--conditions", nargs="+", default=[c["name"] for c in condition_matrix("7B")])
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES), help="Prompts per run")
+    parser.add_argument("--data", choices=("synthetic", "files"), default="synthetic",
+                        help="synthetic: generated personas/profiles/examples; files: the real input CSVs")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="manifest")
+    parser.add_argument("--pipeline", action="store_true", help="Run with generation_engine --pipeline")
+    parser.add_argument("--no-packing", action="store_true")
+    parser.add_argument("--word-budget", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the mock model sleeps per prompt")
+    parser.add_argument("--decode-tps", type=float, default=None, help="Mock decode speed in tokens/s")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default="benchmark_results.csv")
+    parser.add_argument("--baseline", default=None, help="Earlier --results file to compare per-row overhead with")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    options = {
+        "data": args.data,
+        "output_format": args.output_format,
+        "pipeline": args.pipeline,
+        "no_packing": args.no_packing,
+        "word_budget": args.word_budget,
+        "latency": args.latency,
+        "decode_tps": args.decode_tps,
+        "seed": args.seed,
+    }
+
+    results = []
+    for n_prompts in args.sizes:
+        for model_size in args.models:
+            for cond_name in args.conditions:
+                result = run_isolated(run_config, model_size, cond_name, n_prompts, options)
+                results.append(result)
+                print(f"{model_size:>4} {cond_name:<14} {n_prompts:>7} prompts: {result['us_per_row']:8.0f} us/row, "
+                      f"{result['rows_per_sec']:8.0f} rows/s, peak {result['peak_rss_mb']:6.0f} MB")
+
+    results = pd.DataFrame(results, columns=RESULT_COLUMNS)
+    results.to_csv(args.results, index=False)
+    print(f"Saved {len(results)} result(s) to {args.results}")
+    if args.baseline:
+        print(compare(results, args.baseline).to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+
+if __name__ == "__main__":
+    main()
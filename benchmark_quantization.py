@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+import os
+import re
+import glob
+import time
+import random
+import argparse
+import numpy as np
+import pandas as pd
+
+from autotune import measure, sample_prompts
+from benchmark_pipeline import peak_rss_mb, run_isolated
+from generation_engine import MODELS, load_model
+
+HELDOUT_FILE = "mhc_500words (1).jsonl"
+QUANT_RE = re.compile(r"(?<![A-Za-z0-9])(I?Q\d+(?:_[A-Z0-9]+)*|F16|BF16|F32)(?![A-Za-z0-9])", re.IGNORECASE)
+RESULT_COLUMNS = [
+    "quant", "file", "file_mb", "description", "load_s", "peak_rss_mb", "prompt_tok_s", "decode_tok_s",
+    "ms_per_row", "perplexity", "heldout_tokens", "pareto",
+]
+
+
+# ================================
+# Inputs
+# ================================
+def find_ggufs(paths):
+    """GGUF files given directly or found in the given directories, sorted by size."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(glob.escape(path), "*.gguf")))
+        else:
+            files.append(path)
+    if not files:
+        raise FileNotFoundError(f"No .gguf files in {', '.join(paths)}")
+    return sorted(set(files), key=os.path.getsize)
+
+
+def quant_label(path):
+    """Quantization type from the file name (Q4_K_M, IQ1_S, F16, ...), else the file name."""
+    match = QUANT_RE.search(os.path.basename(path))
+    return match.group(1).upper() if match else os.path.splitext(os.path.basename(path))[0]
+
+
+def heldout_texts(path, n_texts, seed=0):
+    """`n_texts` real comments from a CSV or JSON-lines file with a `text` column."""
+    df = pd.read_json(path, lines=True) if path.endswith(".jsonl") else pd.read_csv(path)
+    texts = df["text"].dropna().astype(str)
+    texts = texts[texts.str.strip() != ""]
+    return texts.sample(min(n_texts, len(texts)), random_state=seed).tolist()
+
+
+# ================================
+# One GGUF per process
+# ================================
+def perplexity(llm, texts, max_tokens):
+    """
+    Token perplexity of the texts, each cut to its first `max_tokens` tokens.
+    The model must be loaded with logits_all=True and n_ctx >= max_tokens.
+    """
+    nll, count = 0.0, 0
+    for text in texts:
+        tokens = llm.tokenize(text.encode("utf-8"), add_bos=True)[:max_tokens]
+        if len(tokens) < 2:
+            continue
+        llm.reset()
+        llm.eval(tokens)
+        logits = np.asarray(llm.scores[:len(tokens) - 1], dtype=np.float64)
+        logits -= logits.max(axis=1, keepdims=True)
+        log_probs = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+        nll -= log_probs[np.arange(len(tokens) - 1), tokens[1:]].sum()
+        count += len(tokens) - 1
+    return (float(np.exp(nll / count)) if count else None), count
+
+
+def run_variant(model_size, model_path, prompts, texts, options):
+    """Load one GGUF, time the prompt sample, then score the held-out comments."""
+    overrides = {}
+    if options["n_gpu_layers"] is not None:
+        overrides["n_gpu_layers"] = options["n_gpu_layers"]
+
+    started = time.perf_counter()
+    llm = load_model(model_size, tuning_dir=None, model_path=model_path, **overrides)
+    load_s = time.perf_counter() - started
+    speed = measure(llm, prompts, options["decode_tokens"])
+    # Memory while generating; the scoring model below is loaded separately
+    rss = peak_rss_mb()
+    description = llm._model.desc()
+    llm.close()
+
+    ppl, n_tokens = None, 0
+    if texts:
+        llm = load_model(model_size, tuning_dir=None, model_path=model_path, logits_all=True,
+                         n_ctx=options["heldout_tokens"], **overrides)
+        ppl, n_tokens = perplexity(llm, texts, options["heldout_tokens"])
+        llm.close()
+
+    return {
+        "quant": quant_label(model_path),
+        "file": model_path,
+        "file_mb": os.path.getsize(model_path) / (1 << 20),
+        "description": description,
+        "load_s": load_s,
+        "peak_rss_mb": rss,
+        "prompt_tok_s": speed["prompt_tok_s"],
+        "decode_tok_s": speed["decode_tok_s"],
+        "ms_per_row": speed["ms_per_row"],
+        "perplexity": ppl,
+        "heldout_tokens": n_tokens,
+    }
+
+
+# ================================
+# Report
+# ================================
+def pareto_front(results, minimize=("perplexity", "peak_rss_mb"), maximize=("decode_tok_s",)):
+    """Mask of the rows no other row matches or beats on every objective while beating it on one."""
+    values = np.column_stack([results[c].astype(float) for c in minimize]
+                             + [-results[c].astype(float) for c in maximize])
+    values = np.where(np.isnan(values), np.inf, values)
+    return np.array([
+        not ((values <= row).all(axis=1) & (values < row).any(axis=1)).any()
+        for row in values
+    ])
+
+
+def plot_front(results, path):
+    """Decode speed against perplexity, Pareto-optimal variants highlighted and labelled with their memory."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(7, 5))
+    for pareto, color, label in ((False, "tab:grey", "dominated"), (True, "tab:red", "Pareto-optimal")):
+        subset = results[results["pareto"] == pareto]
+        ax.scatter(subset["decode_tok_s"], subset["perplexity"], color=color, label=label)
+    for _, row in results.iterrows():
+        ax.annotate(f"{row['quant']}\n{row['peak_rss_mb']:.0f} MB", (row["decode_tok_s"], row["perplexity"]),
+                    xytext=(4, 4), textcoords="offset points", fontsize=8)
+    ax.set_xlabel("Decode tokens/s")
+    ax.set_ylabel("Perplexity on held-out real comments")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare GGUF quantizations of one model: load time, memory, prompt and decode speed on a "
+                    "fixed sample of generation prompts, and perplexity on held-out real comments."
+    )
+    parser.add_argument("models", nargs="+", help="GGUF files, or directories of them")
+    parser.add_argument("--model", choices=sorted(MODELS), default="7B",
+                        help="Model entry whose load settings and prompt conditions to use")
+    parser.add_argument("--conditions", nargs="+", default=None,
+                        help="Conditions whose prompts make up the sample (default: all)")
+    parser.add_argument("--prompts", type=int, default=8, help="Prompts timed per GGUF")
+    parser.add_argument("--decode-tokens", type=int, default=32, help="Tokens generated per timed prompt")
+    parser.add_argument("--heldout", default=HELDOUT_FILE, help="CSV or JSON-lines file of real comments (`text`)")
+    parser.add_argument("--heldout-texts", type=int, default=32, help="Comments scored for perplexity (0: skip)")
+    parser.add_argument("--heldout-tokens", type=int, default=512, help="Tokens scored per comment")
+    parser.add_argument("--n-gpu-layers", type=int, default=None,
+                        help="Override the model entry's offload, e.g. 0 to compare on CPU")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default="quantization_results.csv")
+    parser.add_argument("--plot", default=None, help="Also save a speed/perplexity plot here (needs matplotlib)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = find_ggufs(args.models)
+    options = {
+        "decode_tokens": args.decode_tokens,
+        "heldout_tokens": args.heldout_tokens,
+        "n_gpu_layers": args.n_gpu_layers,
+    }
+
+    # Same prompts and comments for every variant
+    random.seed(args.seed)
+    # Few-shot prompts are packed with the first GGUF's vocabulary, shared by all quantizations
+    prompts = sample_prompts(args.model, args.conditions, args.prompts, seed=args.seed, model_path=paths[0])
+    texts = heldout_texts(args.heldout, args.heldout_texts, seed=args.seed) if args.heldout_texts else []
+    print(f"Benchmarking {len(paths)} GGUF(s) on {len(prompts)} prompts and {len(texts)} held-out comments")
+
+    results = []
+    for path in paths:
+        try:
+            result = run_isolated(run_variant, args.model, path, prompts, texts, options)
+        except Exception as e:
+            print(f"{os.path.basename(path)} failed: {e}")
+            continue
+        results.append(result)
+        ppl = f"{result['perplexity']:.2f}" if result["perplexity"] is not None else "n/a"
+        print(f"{result['quant']:<10} load {result['load_s']:6.1f} s, peak {result['peak_rss_mb']:7.0f} MB, "
+              f"prompt {result['prompt_tok_s'] or 0:7.1f} tok/s, decode {result['decode_tok_s'] or 0:6.1f} tok/s, "
+              f"perplexity {ppl}")
+    if not results:
+        return
+
+    results = pd.DataFrame(results)
+    results["pareto"] = pareto_front(results)
+    results = results.sort_values("decode_tok_s", ascending=False)[RESULT_COLUMNS]
+    results.to_csv(args.results, index=False)
+    print(results[["quant", "file_mb", "peak_rss_mb", "prompt_tok_s", "decode_tok_s", "perplexity", "pareto"]]
+          .to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    print(f"Saved {len(results)} result(s) to {args.results}")
+    if args.plot:
+        plot_front(results, args.plot)
+        print(f"Saved plot to {args.plot}")
+
+
+if __name__ == "__main__":
+    main()
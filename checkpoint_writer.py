@@ -0,0 +1,194 @@
+import os
+import csv
+import sys
+import json
+import pandas as pd
+
+# Generated comments and prompts can exceed the csv module's default field limit
+csv.field_size_limit(sys.maxsize)
+
+
+def state_path(output_path):
+    return f"{output_path}.state.json"
+
+
+def load_state(output_path):
+    path = state_path(output_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(output_path, state):
+    path = state_path(output_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def manifest_path(output_path):
+    return f"{output_path}.manifest.json"
+
+
+def load_manifest(output_path):
+    path = manifest_path(output_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(output_path, manifest):
+    path = manifest_path(output_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def failures_path(output_path):
+    return f"{output_path}.failures.csv"
+
+
+def load_failed_tids(output_path):
+    """TIDs listed in an output's failure file (see validate_outputs.py)."""
+    path = failures_path(output_path)
+    if not os.path.exists(path):
+        return set()
+    return set(pd.read_csv(path, usecols=["TID"])["TID"].tolist())
+
+
+def save_failures(output_path, failures):
+    """Write the (TID, failed_checks) frame that --regenerate re-runs."""
+    failures.to_csv(failures_path(output_path), index=False)
+
+
+def read_verbatim(path):
+    """Read an output CSV with every field as the string it was written as."""
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def repair_partial_tail(path):
+    """
+    Drop a trailing row that was cut off by a crash mid-write. Rows are
+    flushed in whole batches, so at most the last batch can be incomplete.
+    Returns the header (or None for a missing/empty file).
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+
+    with open(path, newline="", encoding="utf-8") as f:
+        # readline() instead of iterating the file keeps f.tell() usable
+        reader = csv.reader(iter(f.readline, ""))
+        header = next(reader, None)
+        good_end = f.tell()
+        rows_ok = True
+        try:
+            while True:
+                row = next(reader, None)
+                if row is None:
+                    break
+                if len(row) != len(header):
+                    rows_ok = False
+                    break
+                good_end = f.tell()
+        except csv.Error:
+            rows_ok = False
+        at_eof = rows_ok and f.tell() == os.path.getsize(path)
+
+    if not at_eof:
+        with open(path, "r+b") as f:
+            f.truncate(good_end)
+    return header
+
+
+def completed_tids(path):
+    """TIDs already present in an output file (after dropping a partial tail)."""
+    header = repair_partial_tail(path)
+    if header is None:
+        return set()
+    return set(pd.read_csv(path, usecols=["TID"])["TID"].tolist())
+
+
+class CheckpointWriter:
+    """
+    Append rows to a CSV as they complete. Rows are buffered and written in
+    batches of `flush_every`, each batch followed by flush + fsync, so a
+    killed job loses at most one batch.
+    """
+
+    def __init__(self, path, flush_every=25):
+        self.path = path
+        self.flush_every = flush_every
+        self.rows_written = 0
+        self._buffer = []
+        self._fieldnames = repair_partial_tail(path)
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = None
+
+    def write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        if self._writer is None:
+            new_file = self._fieldnames is None
+            self._fieldnames = self._fieldnames or list(self._buffer[0].keys())
+            # A resumed file keeps its header; columns added since are dropped
+            self._writer = csv.DictWriter(self._file, fieldnames=self._fieldnames, extrasaction="ignore")
+            if new_file:
+                self._writer.writeheader()
+        self._writer.writerows(self._buffer)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_verbatim(df, path):
+    """Atomically replace `path` with a frame read by read_verbatim."""
+    tmp = path + ".tmp"
+    # Same line terminator as csv.DictWriter so fields with a bare "\r" are quoted
+    df.to_csv(tmp, index=False, lineterminator="\r\n")
+    os.replace(tmp, path)
+
+
+def sort_by_tid(path):
+    """Rewrite a finished output in TID order (rows are appended in completion order)."""
+    df = read_verbatim(path)
+    tids = df["TID"].astype(int)
+    if tids.is_monotonic_increasing:
+        return
+    write_verbatim(df.iloc[tids.argsort(kind="stable")], path)
+
+
+def replace_rows(path, replacement_path):
+    """
+    Swap rows of a finished output for the rows with the same TID in
+    `replacement_path`, keeping TID order. Columns only the replacement has
+    (e.g. Attempt) are left empty on the other rows.
+    """
+    df = read_verbatim(path)
+    new = read_verbatim(replacement_path)
+    df = pd.concat([df[~df["TID"].isin(new["TID"])], new], ignore_index=True).fillna("")
+    write_verbatim(df.iloc[df["TID"].astype(int).argsort(kind="stable")], path)
+    return len(new)
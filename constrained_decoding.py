@@ -0,0 +1,130 @@
+import os
+import bisect
+import numpy as np
+from llama_cpp import LlamaGrammar, LogitsProcessorList
+
+# Terms the prompts tell the model not to use
+FORBIDDEN_TERMS = [
+    "depression",
+    "depressive",
+    "mania",
+    "mental illness",
+    "mental health",
+    "diagnosed with",
+    "suffering from",
+    "MDD",
+]
+
+# One paragraph: starts with text (no heading, bullet or markup) after an
+# optional space, which SentencePiece/BPE vocabularies put on the first
+# piece of a completion; no line breaks and no '#', so no title line,
+# hashtags or trailing notes
+SINGLE_COMMENT_GRAMMAR = r"""
+root ::= " "? start body
+start ::= [^#*>\[\n\t -]
+body ::= [^#\n]*
+"""
+GRAMMARS = {"single_comment": SINGLE_COMMENT_GRAMMAR}
+
+_processors = {}
+_grammars = {}
+
+
+def token_texts(llm):
+    """Lowercased text of every token, with the leading space SentencePiece pieces carry."""
+    return [
+        llm._model.token_to_piece(token).rstrip(b"\0").decode("utf-8", errors="ignore").lower()
+        for token in range(llm.n_vocab())
+    ]
+
+
+def _at_word_start(text, pos):
+    return pos == 0 or not text[pos - 1].isalnum()
+
+
+class BannedTermsProcessor:
+    """
+    Logits processor that adds `bias` (default -inf: never sample) to every
+    token that would complete a banned term at the start of a word, in any
+    case and however the term is split into tokens: the tokens whose text
+    starts with the rest of a term whose beginning the generated text ends
+    with, and those holding a whole term after a space or punctuation. Called
+    as processor(input_ids, logits), the llama-cpp-python LogitsProcessor
+    signature.
+    """
+
+    def __init__(self, llm, terms, bias=None):
+        self.llm = llm
+        self.bias = -np.inf if bias is None else bias
+        self.terms = sorted({term.lower() for term in terms if term})
+        texts = token_texts(llm)
+        order = sorted(range(len(texts)), key=texts.__getitem__)
+        self._sorted_ids = np.array(order, dtype=np.intp)
+        self._sorted_texts = [texts[i] for i in order]
+        self._starting = {}
+        # Tokens containing a term after a non-alphanumeric character are banned outright
+        inside = set()
+        for term in self.terms:
+            for token, text in enumerate(texts):
+                pos = text.find(term, 1)
+                while pos != -1:
+                    if not text[pos - 1].isalnum():
+                        inside.add(token)
+                        break
+                    pos = text.find(term, pos + 1)
+        self._inside = np.array(sorted(inside), dtype=np.intp)
+        # Generated tokens decoded per step: enough to hold any term's beginning
+        self._tail_tokens = max(len(term) for term in self.terms)
+
+    def _tokens_starting(self, text):
+        """IDs of the tokens whose text starts with `text`."""
+        ids = self._starting.get(text)
+        if ids is None:
+            lo = bisect.bisect_left(self._sorted_texts, text)
+            hi = bisect.bisect_left(self._sorted_texts, text + "\U0010ffff")
+            ids = self._starting[text] = self._sorted_ids[lo:hi]
+        return ids
+
+    def __call__(self, input_ids, scores):
+        tail = self.llm.detokenize(list(input_ids[-self._tail_tokens:])).decode("utf-8", errors="ignore").lower()
+        scores[self._inside] += self.bias
+        for term in self.terms:
+            for k in range(len(term)):
+                if tail.endswith(term[:k]) and _at_word_start(tail, len(tail) - k):
+                    scores[self._tokens_starting(term[k:])] += self.bias
+        return scores
+
+
+def banned_terms_processor(llm, gen_config):
+    """The BannedTermsProcessor for gen_config's `banned_terms` and `ban_bias` on this model, or None."""
+    terms = gen_config.get("banned_terms")
+    if not terms:
+        return None
+    key = (id(llm), tuple(terms), gen_config.get("ban_bias"))
+    if key not in _processors:
+        _processors[key] = BannedTermsProcessor(llm, terms, bias=gen_config.get("ban_bias"))
+    return _processors[key]
+
+
+def load_grammar(spec):
+    """GBNF text for a built-in grammar name (see GRAMMARS) or a .gbnf file."""
+    if spec in GRAMMARS:
+        return GRAMMARS[spec]
+    if not os.path.isfile(spec):
+        raise ValueError(f"--grammar must be one of {sorted(GRAMMARS)} or a .gbnf file, got {spec!r}")
+    with open(spec, encoding="utf-8") as f:
+        return f.read()
+
+
+def sampling_constraints(llm, gen_config):
+    """Keyword arguments for Llama.__call__ applying gen_config's banned terms and GBNF `grammar`."""
+    constraints = {}
+    processor = banned_terms_processor(llm, gen_config)
+    if processor is not None:
+        constraints["logits_processor"] = LogitsProcessorList([processor])
+    grammar = gen_config.get("grammar")
+    if grammar:
+        if grammar not in _grammars:
+            _grammars[grammar] = LlamaGrammar.from_string(grammar, verbose=False)
+        constraints["grammar"] = _grammars[grammar]
+    return constraints
@@ -0,0 +1,41 @@
+import numpy as np
+
+# KV cache sizes are rounded up to a multiple of this many tokens
+CTX_GRANULARITY = 256
+
+
+def fit_context(n_prompt_tokens, max_tokens, limit, granularity=CTX_GRANULARITY):
+    """Smallest multiple of `granularity` holding a prompt, its completion and a spare token, at most `limit`."""
+    needed = n_prompt_tokens + max_tokens + 1
+    return min(-(-needed // granularity) * granularity, limit)
+
+
+def length_buckets(entries, lengths, max_tokens, limit, n_buckets=1, granularity=CTX_GRANULARITY):
+    """
+    Order prompt entries by token length and split them into at most
+    `n_buckets` runs of about equal size, each with the per-sequence context
+    its longest prompt needs: [(n_ctx, entries)], shortest first. Runs that
+    round to the same context are merged.
+    """
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    buckets = []
+    for part in np.array_split(order, max(1, min(n_buckets, len(order)))):
+        if not len(part):
+            continue
+        n_ctx = fit_context(int(lengths[part[-1]]), max_tokens, limit, granularity)
+        members = [entries[i] for i in part]
+        if buckets and buckets[-1][0] == n_ctx:
+            buckets[-1][1].extend(members)
+        else:
+            buckets.append((n_ctx, members))
+    return buckets
+
+
+def parallel_for(n_ctx, kv_tokens, n_parallel, max_parallel, n_prompts):
+    """
+    Sequences to run with `n_ctx` tokens each: as many as the `kv_tokens` of
+    the configured KV cache hold, between `n_parallel` and `max_parallel`,
+    and no more than there are prompts.
+    """
+    fits = max(n_parallel, min(kv_tokens // n_ctx, max_parallel))
+    return max(1, min(fits, n_prompts))
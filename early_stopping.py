@@ -0,0 +1,75 @@
+import re
+
+# Stop sequences for what models tend to write after the comment: a second
+# title or preamble, notes, word counts and hashtag lines. They all need a
+# line break or bracket before them, so a leading title is left alone.
+PREAMBLE_STOPS = [
+    "\nTitle:",
+    "\n**Title",
+    "\n\nHere is",
+    "\n\nHere's",
+    "\n\nNote:",
+    "(Note:",
+    "(Word count",
+    "\nWord count:",
+    "\n\n---",
+    "\n\n#",
+    "[INST]",
+    "<|eot_id|>",
+]
+
+# Words past the budget after which generation stops even mid-sentence
+MAX_OVERRUN = 40
+
+_WORD = re.compile(r"\S+")
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*(?=\s)|\n\s*\n")
+
+
+def word_budget_cut(text, budget, final=False):
+    """
+    Position to cut `text` at: the end of the sentence containing the
+    budget-th word, or the end of the word MAX_OVERRUN words later. None
+    while the text is still short of that. While streaming, a sentence only
+    counts as finished once whitespace follows it; pass final=True for a
+    complete text.
+    """
+    words = list(_WORD.finditer(text))
+    if len(words) < budget:
+        return None
+    match = _SENTENCE_END.search(text, words[budget - 1].start())
+    if match is not None:
+        return match.end() if match.group().strip() else match.start()
+    if final and re.search(r"[.!?…][\"'”’)\]]*\s*$", text):
+        return len(text.rstrip())
+    if len(words) > budget + MAX_OVERRUN:
+        return words[budget + MAX_OVERRUN - 1].end()
+    return None
+
+
+def apply_word_budget(text, budget):
+    """Trim a finished completion to its word budget; returns (text, was_cut)."""
+    if not budget:
+        return text, False
+    cut = word_budget_cut(text, budget, final=True)
+    if cut is None or cut >= len(text.rstrip()):
+        return text, False
+    return text[:cut].rstrip(), True
+
+
+class WordBudgetCriteria:
+    """
+    llama-cpp-python stopping criterion that ends generation once the
+    completion reaches the end of the sentence after `budget` words.
+    """
+
+    def __init__(self, llm, n_prompt_tokens, budget):
+        self.llm = llm
+        self.n_prompt_tokens = n_prompt_tokens
+        self.budget = budget
+
+    def __call__(self, input_ids, logits):
+        completion = input_ids[self.n_prompt_tokens:]
+        if len(completion) < self.budget:
+            return False
+        text = self.llm.detokenize(completion.tolist()).decode("utf-8", errors="ignore")
+        return word_budget_cut(text, self.budget) is not None
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import json
+import time
+import asyncio
+import argparse
+import hashlib
+
+
+class FakeLlamaServer:
+    """
+    Stand-in for llama.cpp's server: answers /v1/completions with a canned,
+    prompt-dependent completion after `delay` seconds, serving at most
+    `slots` requests at a time like `llama-server --parallel`. It records
+    request and connection counts and the peak number of requests in flight
+    so client concurrency and connection reuse can be checked without a model.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.05, slots=4, words=80, n_ctx=4096):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.slots = slots
+        self.words = words
+        self.n_ctx = n_ctx
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._server = None
+
+    @staticmethod
+    def _token_id(word):
+        """Whitespace "tokenizer": one token per word."""
+        return int(hashlib.sha1(word.encode("utf-8")).hexdigest()[:4], 16)
+
+    def canned_text(self, prompt):
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        return " ".join(f"word{digest[i % len(digest)]}{i}" for i in range(self.words))
+
+    async def _complete(self, payload):
+        async with self._slots:
+            started = time.perf_counter()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(self.delay)
+            finally:
+                self.in_flight -= 1
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+        text = self.canned_text(payload.get("prompt", ""))
+        n_words = min(self.words, payload.get("max_tokens", self.words))
+        text = " ".join(text.split()[:n_words])
+        prompt_tokens = len(payload.get("prompt", "").split())
+        return {
+            "id": f"cmpl-{self.requests}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": "fake-model",
+            "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": "length"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": n_words,
+                "total_tokens": prompt_tokens + n_words,
+            },
+            "timings": {
+                "prompt_n": prompt_tokens,
+                "prompt_ms": elapsed_ms / 4,
+                "predicted_n": n_words,
+                "predicted_ms": elapsed_ms * 3 / 4,
+            },
+        }
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                self.requests += 1
+                if method == "POST" and path in ("/v1/completions", "/completion"):
+                    status, response = 200, await self._complete(json.loads(body or b"{}"))
+                elif method == "POST" and path == "/tokenize":
+                    words = json.loads(body or b"{}").get("content", "").split()
+                    status, response = 200, {"tokens": [self._token_id(w) for w in words]}
+                elif method == "POST" and path == "/detokenize":
+                    tokens = json.loads(body or b"{}").get("tokens", [])
+                    status, response = 200, {"content": " ".join(f"t{t}" for t in tokens)}
+                elif method == "GET" and path == "/props":
+                    status, response = 200, {"default_generation_settings": {"n_ctx": self.n_ctx}}
+                elif method == "GET" and path == "/v1/models":
+                    status, response = 200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]}
+                elif method == "GET" and path == "/health":
+                    status, response = 200, {"status": "ok"}
+                else:
+                    status, response = 404, {"error": f"Unknown endpoint {method} {path}"}
+
+                data = json.dumps(response).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    "Connection: keep-alive\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.slots)
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+def start_in_thread(**kwargs):
+    """Run a FakeLlamaServer on a background event loop; returns the server once it listens."""
+    import threading
+
+    server = FakeLlamaServer(**kwargs)
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="fake-llama-server", daemon=True).start()
+    ready.wait()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Canned-completion stand-in for a local llama.cpp server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--delay", type=float, default=0.05, help="Seconds per completion")
+    parser.add_argument("--slots", type=int, default=4, help="Requests served concurrently")
+    parser.add_argument("--words", type=int, default=80, help="Words per canned completion")
+    args = parser.parse_args()
+
+    async def serve():
+        server = await FakeLlamaServer(args.host, args.port, args.delay, args.slots, args.words).start()
+        print(f"Fake llama.cpp server listening on {server.url}")
+        await server._server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import numpy as np
+
+# Tokens for the "- " bullet and blank line around each example
+EXAMPLE_OVERHEAD_TOKENS = 4
+
+
+class FewShotPacker:
+    """
+    Choose which of a row's sampled few-shot examples go into its prompt so
+    the prompt stays within `prompt_budget` tokens (n_ctx minus max_tokens).
+
+    Example token lengths are computed once per example and cached. Examples
+    are taken in sampled order and skipped when they no longer fit; with
+    `clip_tokens`, longer examples are first cut at a word boundary to about
+    that many tokens. The finished prompt is tokenized once to confirm it
+    fits, dropping the last example until it does.
+
+    `tokenize` maps text to a list of token IDs and `detokenize` back.
+    """
+
+    def __init__(self, tokenize, detokenize, texts, prompt_budget, clip_tokens=None):
+        self.tokenize = tokenize
+        self.detokenize = detokenize
+        self.texts = texts
+        self.prompt_budget = prompt_budget
+        self.clip_tokens = clip_tokens
+        self._lengths = np.full(len(texts), -1, dtype=np.int32)
+        self._clip_chars = {}
+        self.reset_counts()
+
+    def reset_counts(self):
+        """Zero the row counters in stats(); example lengths stay cached."""
+        self.rows = 0
+        self.reduced_rows = 0
+        self.clipped_examples = 0
+        self.over_budget_rows = 0
+
+    def n_tokens(self, text):
+        return len(self.tokenize(text))
+
+    def example_length(self, position):
+        if self._lengths[position] < 0:
+            self._lengths[position] = self.n_tokens(self.texts[position])
+        return int(self._lengths[position])
+
+    def clip_chars(self, position):
+        """Characters of an over-long example kept when clipping (a word-boundary prefix)."""
+        if position not in self._clip_chars:
+            text = self.texts[position]
+            kept = self.tokenize(text)[:self.clip_tokens]
+            approx = len(self.detokenize(kept))
+            cut = text.rfind(" ", 0, approx + 1)
+            self._clip_chars[position] = cut if cut > 0 else approx
+        return self._clip_chars[position]
+
+    def pack(self, positions, build_prompt):
+        """
+        Return (positions, clips, prompt) for one row. `build_prompt` turns a
+        list of example texts (or None for no few-shot section) into the
+        prompt; `clips` maps clipped positions to their kept characters.
+        """
+        self.rows += 1
+        remaining = self.prompt_budget - self.n_tokens(build_prompt([]))
+
+        chosen, clips = [], {}
+        for position in positions:
+            position = int(position)
+            length = self.example_length(position)
+            if self.clip_tokens and length > self.clip_tokens:
+                clips[position] = self.clip_chars(position)
+                length = self.clip_tokens
+            if length + EXAMPLE_OVERHEAD_TOKENS <= remaining:
+                chosen.append(position)
+                remaining -= length + EXAMPLE_OVERHEAD_TOKENS
+
+        while True:
+            texts = [self.example_text(p, clips) for p in chosen]
+            prompt = build_prompt(texts if chosen else None)
+            if not chosen or self.n_tokens(prompt) <= self.prompt_budget:
+                break
+            chosen.pop()
+
+        if len(chosen) < len(positions):
+            self.reduced_rows += 1
+        if not chosen and self.n_tokens(prompt) > self.prompt_budget:
+            self.over_budget_rows += 1
+        clips = {p: clips[p] for p in chosen if p in clips}
+        self.clipped_examples += len(clips)
+        return chosen, clips, prompt
+
+    def example_text(self, position, clips):
+        text = self.texts[position]
+        return text[:clips[position]] if position in clips else text
+
+    def stats(self):
+        return {
+            "rows": self.rows,
+            "rows_with_fewer_examples": self.reduced_rows,
+            "clipped_examples": self.clipped_examples,
+            "rows_over_budget": self.over_budget_rows,
+            "examples_tokenized": int((self._lengths >= 0).sum()),
+        }
+
+
+def parse_few_shot_ids(value):
+    """'12 40:318 7' -> ([12, 40, 7], {40: 318}); ':n' marks an example clipped to n characters."""
+    ids, clips = [], {}
+    for item in str(value).split():
+        example_id, _, chars = item.partition(":")
+        ids.append(int(example_id))
+        if chars:
+            clips[int(example_id)] = int(chars)
+    return ids, clips
+
+
+def format_few_shot_ids(ids, clips):
+    return " ".join(f"{i}:{clips[i]}" if i in clips else str(i) for i in ids)
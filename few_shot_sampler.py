@@ -0,0 +1,24 @@
+import numpy as np
+
+
+def sample_index_matrix(pool_size, n_rows, k, seed=None):
+    """
+    Draw k distinct example positions from a pool of `pool_size` for each of
+    `n_rows` prompts, as an (n_rows, k) int32 matrix reproducible from `seed`.
+
+    Uses Floyd's subset algorithm vectorized over rows: k steps of one
+    integer draw per row, so cost is O(n_rows * k^2) regardless of the pool
+    size. Rows are shuffled afterwards so example order is random too.
+    """
+    if k > pool_size:
+        raise ValueError(f"Cannot draw {k} distinct examples from a pool of {pool_size}")
+    if pool_size > np.iinfo(np.int32).max:
+        raise ValueError(f"Pool of {pool_size} examples does not fit int32 indices")
+
+    rng = np.random.default_rng(seed)
+    matrix = np.empty((n_rows, k), dtype=np.int32)
+    for col, j in enumerate(range(pool_size - k, pool_size)):
+        draw = rng.integers(0, j + 1, size=n_rows, dtype=np.int32)
+        taken = (matrix[:, :col] == draw[:, None]).any(axis=1)
+        matrix[:, col] = np.where(taken, j, draw)
+    return rng.permuted(matrix, axis=1)
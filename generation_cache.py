@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import deque
+
+# Bytes hashed from each end of a GGUF for its fingerprint
+FINGERPRINT_BYTES = 4 << 20
+DEFAULT_CACHE_MB = 1024
+# Least recently used entries read per eviction query
+EVICT_BATCH = 64
+
+_fingerprints = {}
+
+
+def model_fingerprint(model_path):
+    """
+    Content hash of a model file: its size plus the first and last
+    FINGERPRINT_BYTES (the GGUF header and the last tensors), so a copied or
+    renamed file keeps its cache entries without reading tens of GB. Names
+    that are not local files (a server's model id) are hashed as given.
+    """
+    if not os.path.isfile(model_path):
+        return hashlib.sha256(f"name:{model_path}".encode("utf-8")).hexdigest()
+    stat = os.stat(model_path)
+    cache_key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    if cache_key not in _fingerprints:
+        digest = hashlib.sha256(str(stat.st_size).encode("ascii"))
+        with open(model_path, "rb") as f:
+            digest.update(f.read(FINGERPRINT_BYTES))
+            f.seek(max(0, stat.st_size - FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+        _fingerprints[cache_key] = digest.hexdigest()
+    return _fingerprints[cache_key]
+
+
+def as_cache_hit(completion, lookup_ms):
+    """
+    A stored completion as answered now: flagged `cached`, with the lookup
+    as its latency and zeroed model timings, so run metrics do not count the
+    original run's time again.
+    """
+    hit = dict(completion, cached=True, latency_ms=lookup_ms)
+    hit["timings"] = {"prompt_n": 0, "prompt_ms": 0.0, "predicted_n": 0, "predicted_ms": 0.0}
+    hit.pop("speculative", None)
+    return hit
+
+
+class GenerationCache:
+    """
+    Completions stored in SQLite under a hash of (model file, prompt,
+    gen_config, seed), so a request that was answered before is not sent to
+    the model again. Only seeded, successful completions are stored. When
+    the stored completions exceed `max_bytes` the least recently used ones
+    are dropped. One file can be shared by several processes (WAL mode).
+
+    The stored size is summed once on opening and then kept up to date by
+    put and eviction; what other processes add is picked up by stats().
+    """
+
+    def __init__(self, path, model_path, max_bytes=DEFAULT_CACHE_MB << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.model = model_fingerprint(model_path)
+        self.reset_counts()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, completion TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def reset_counts(self):
+        """Zero the hit, miss and eviction counters in stats(); stored completions are kept."""
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def key(self, prompt, gen_config, seed):
+        request = {"model": self.model, "prompt": prompt, "gen_config": gen_config, "seed": seed}
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT completion FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, completion):
+        data = json.dumps(completion)
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            self._total += len(data) - (old[0] if old else 0)
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, completion, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        while self._total > self.max_bytes:
+            oldest = self._db.execute(
+                "SELECT key, size FROM completions ORDER BY last_used LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not oldest:
+                self._total = 0
+                return
+            for key, size in oldest:
+                if self._total <= self.max_bytes:
+                    return
+                self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._total -= size
+                self.evicted += 1
+
+    def complete(self, entries, gen_config, backend):
+        """
+        Yield (entry, completion) pairs like a backend, answering cached
+        requests directly and passing only the others to `backend`, a
+        callable that takes an entry iterable. Hits come out in order just
+        ahead of the next completion the backend returns; see as_cache_hit.
+        """
+        hits = deque()
+        keys = {}
+
+        def uncached():
+            for entry in entries:
+                if entry.get("seed") is None:
+                    yield entry
+                    continue
+                started = time.perf_counter()
+                key = self.key(entry["prompt"], gen_config, entry["seed"])
+                completion = self.get(key)
+                if completion is None:
+                    keys[id(entry)] = key
+                    yield entry
+                else:
+                    hits.append((entry, as_cache_hit(completion, (time.perf_counter() - started) * 1000.0)))
+
+        for entry, completion in backend(uncached()):
+            while hits:
+                yield hits.popleft()
+            key = keys.pop(id(entry), None)
+            if key is not None and "error" not in completion:
+                self.put(key, completion)
+            yield entry, completion
+        while hits:
+            yield hits.popleft()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+            self._total = size
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted, "entries": entries, "bytes": size}
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,1265 @@
+#!/usr/bin/env python3
+import os
+import io
+import random
+import hashlib
+import time
+import argparse
+import contextlib
+import pandas as pd
+from datetime import datetime
+from tqdm import tqdm
+from llama_cpp import Llama, StoppingCriteriaList
+
+from batched_decoding import DEFAULT_N_BATCH, BatchedGenerator
+from early_stopping import PREAMBLE_STOPS, WordBudgetCriteria, apply_word_budget
+from context_sizing import length_buckets, parallel_for
+from constrained_decoding import FORBIDDEN_TERMS, GRAMMARS, load_grammar, sampling_constraints
+from checkpoint_writer import (CheckpointWriter, completed_tids, failures_path, load_failed_tids, load_manifest,
+                               load_state, manifest_path, read_verbatim, replace_rows, save_failures, save_manifest,
+                               save_state, sort_by_tid)
+from generation_cache import DEFAULT_CACHE_MB, GenerationCache
+from few_shot_packing import FewShotPacker, format_few_shot_ids, parse_few_shot_ids
+from few_shot_sampler import sample_index_matrix
+from hardware_profile import TUNING_DIR, available_cpus, load_profile
+from near_duplicates import DuplicateTracker, duplicates_path, write_duplicates
+from pipeline import ThreadedWriter, prefetch, sorted_windows
+from prefix_cache import PrefixCache
+from prompt_tokens import TOKEN_CACHE_DIR, PromptTokenizer
+from run_metrics import (attach_llama_timings, completion_metrics, elapsed_ms, error_metrics,
+                         reset_llama_timings, summarize_output)
+from server_backend import ServerBackend
+from worker_backend import DEFAULT_SOCKET, WorkerBackend
+from speculative import (DEFAULT_DRAFT_TOKENS, DEFAULT_LOOKUP_NGRAM, SPECULATIVE_MODES, DraftModel,
+                         PromptLookupDraft, check_vocab)
+from profile_generator import (
+    generate_profile,
+    load_occupations,
+    load_interests,
+    load_subreddits,
+    load_nationalities
+)
+
+# ================================
+# Models
+# ================================
+MODELS = {
+    "7B": {
+        "model_path": "./models/Mistral-7B-Instruct-v0.2.Q4_K_M.gguf",
+        "n_gpu_layers": 35,
+    },
+    "70B": {
+        "model_path": "./models/Meta-Llama-3-70B-Instruct.IQ1_S.gguf",
+        "n_gpu_layers": 81,
+    },
+}
+
+LLAMA_DEFAULTS = {
+    "n_ctx": 2048,
+    "n_threads": 48,
+    "verbose": False,
+}
+
+GEN_CONFIG = {
+    "max_tokens": 200,
+    "temperature": 0.8,
+    "top_p": 0.95,
+    "top_k": 40,
+    "repeat_penalty": 1.1,
+    "presence_penalty": 0.0,
+    "frequency_penalty": 0.0,
+    "stop": ["</s>"],
+    # Stop at the end of the sentence after this many words (None: off)
+    "word_budget": None,
+}
+
+PROMPT_LAYOUTS = ("persona_first", "prefix_first")
+OUTPUT_FORMATS = ("manifest", "wide")
+# Most prompts regrouped by prefix at once in the prefix_first layout
+PREFIX_SORT_WINDOW = 4096
+
+FEW_SHOT_FILE = "sampled_1000_rows.csv"
+FEW_SHOT_COUNT = 10
+ATTRIBUTE_TOTAL_POSTS = 5400
+
+PERSONA_FILES = {
+    "MDD": "mdd_Persona.csv",
+    "Control": "ctrl_Persona.csv",
+}
+
+# ================================
+# Prompt Templates
+# ================================
+ATTRIBUTE_TEMPLATES = {
+    "MDD": """
+Now independently imagine yourself as a normal reddit user and write exactly one reddit comment that would 
+fit in the subreddit r/{sub_choice}. Your comment must be approximately 80 words long. Exclude hashtags from your response. 
+Do not use titles. Exclude preambles. Don't make explicit references to MDD and keep it implicit. You must avoid using any 
+language related to mental health such as a condition or general terms like “depression”, “mania”, “mental illness”,“diagnosed with”, or “suffering from”.  
+Have a creative start to your response and be creative throughout the response. Focus on general behavior, expression, and tone.
+""",
+    "Control": """
+Now independently imagine yourself as a mentally healthy reddit user who does not have any mental health conditions and write exactly one reddit comment that would 
+fit in the subreddit r/{sub_choice}. Your comment must be approximately 80 words long. Exclude hashtags from your response. 
+Do not use titles. Exclude preambles. Focus on general behavior, expression, and tone.
+Have a creative start to your response and be creative throughout the response.
+""",
+}
+
+ATTRIBUTE_DIVERSITY_PROMPT = """
+Make this comment more diverse than the previous posts. Change the structure at the beginning and throughout your response: 
+it shouldn't follow the format of your previous posts.
+"""
+
+ATTRIBUTE_FEW_SHOT_INSTRUCTION = (
+    "Do not copy or repeat any example comments verbatim. Use them as inspiration to mimic tone, structure, or style."
+)
+
+INFERRED_TEMPLATES = {
+    "MDD": """
+Now independently imagine yourself as a normal reddit user and write exactly one reddit comment. You are diagnosed with the condition: MDD.
+Your comment must be approximately 80 words long. Do not use any hashtags in your comment. Do not use greetings like "hello" or exclamations like "wow"
+at the start. Exclude preambles. The mention of any explicit reference to MDD is not allowed. 
+You must avoid using any language related to mental health such as a condition or general terms like "mental illness", 
+"diagnosed with", or "suffering from". Be creative with your response. Focus on general behavior, expression, and tone. Do not use a title.
+""",
+    "Control": """
+Now independently imagine yourself as a mentally healthy reddit user with no history of mental illness and write exactly one reddit comment.
+Your comment must be approximately 80 words long. Do not use any hashtags in your comment. Do not use greetings like "hello" or exclamations like "wow"
+at the start. Exclude preambles. You must not reference any mental health condition or terms related to mental illness.
+Be creative with your response. Focus on general behavior, expression, and tone. Do not use a title.
+""",
+}
+
+INFERRED_DIVERSITY_PROMPT = """
+Provide something more diverse than the previous posts.
+Change the structure at the beginning of your response: it shouldn't follow the format of your previous posts.
+"""
+
+INFERRED_FEW_SHOT_INSTRUCTION = (
+    "Do not copy or repeat any example comments verbatim. Instead, use them as inspiration to mimic the tone, "
+    "structure, or style in your own unique way."
+)
+
+
+# ================================
+# Condition Matrix
+# ================================
+def condition_matrix(model_size):
+    """
+    All persona type x shot x group conditions for one model. Each condition
+    reproduces one of the former standalone scripts, e.g. `mdd_atb_few` is
+    Attribute-Controlled_fewshot_<size>.py and `ctrl_inf_zero` is
+    ctrl_inferred_zeroshot_<size>.py.
+    """
+    conditions = []
+    for persona_type, short in (("attribute_controlled", "atb"), ("inferred", "inf")):
+        for shot in ("zero", "few"):
+            for group, prefix in (("MDD", "mdd"), ("Control", "ctrl")):
+                # The inferred few-shot outputs were always saved as "..._Few_..."
+                shot_label = "Few" if (persona_type == "inferred" and shot == "few") else shot
+                conditions.append({
+                    "name": f"{prefix}_{short}_{shot}",
+                    "persona_type": persona_type,
+                    "shot": shot,
+                    "group": group,
+                    "model_size": model_size,
+                    # The 7B attribute-controlled few-shot runs used a shorter persona line
+                    "compact_persona": (
+                        persona_type == "attribute_controlled" and shot == "few" and model_size == "7B"
+                    ),
+                    "output": f"{prefix}_{short}_{shot_label}_{model_size}.csv",
+                })
+    return conditions
+
+
+def select_conditions(model_size, names=None):
+    conditions = condition_matrix(model_size)
+    if not names:
+        return conditions
+    by_name = {c["name"]: c for c in conditions}
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown condition(s): {', '.join(unknown)}. Choose from: {', '.join(by_name)}")
+    return [by_name[n] for n in names]
+
+
+# ================================
+# Resources
+# ================================
+def load_resources(conditions):
+    """Load every external file the selected conditions need, once."""
+    resources = {}
+    persona_types = {c["persona_type"] for c in conditions}
+
+    if "attribute_controlled" in persona_types:
+        resources["profile_data"] = {
+            "occupations": load_occupations(),
+            "interests": load_interests(),
+            "subreddits": load_subreddits(),
+            "countries": load_nationalities(),
+        }
+
+    if any(c["shot"] == "few" for c in conditions):
+        few_shot_df = pd.read_csv(FEW_SHOT_FILE)
+        texts = few_shot_df["text"].dropna()
+        # Example pool as arrays; the IDs are the examples' rows in FEW_SHOT_FILE
+        resources["few_shot_texts"] = texts.to_numpy()
+        resources["few_shot_ids"] = texts.index.to_numpy()
+
+    if "inferred" in persona_types:
+        resources["personas"] = {}
+        for group in {c["group"] for c in conditions if c["persona_type"] == "inferred"}:
+            persona_df = pd.read_csv(PERSONA_FILES[group])
+            resources["personas"][group] = persona_df["Generated_persona"].dropna()
+
+    return resources
+
+
+# ================================
+# Prompt Construction
+# ================================
+def attribute_persona_line(profile, compact=False):
+    if compact:
+        line = (
+            f"Your age is: {profile['age']}. You are a {profile['gender']}. "
+            f"Your occupation is: {profile['occupation']}. "
+            f"Your interests are: {', '.join(profile['interests'])}. "
+        )
+    else:
+        line = (
+            f"Your age is: {profile['age']}. You are a {profile['gender']} from {profile['nationality']}. "
+            f"Your occupation is: {profile['occupation']}. Your marital status is: {profile['marital_status']}. "
+            f"Your interests are: {', '.join(profile['interests'])}. "
+        )
+    if profile["condition"] == "MDD":
+        line += f"You are diagnosed with the condition: {profile['condition']}."
+    return line
+
+
+def inferred_persona_line(persona):
+    return f"You are: {persona}."
+
+
+def format_few_shot_block(examples):
+    return "\n\n".join(f"- {ex}" for ex in examples)
+
+
+def few_shot_matrix(cond, resources, seed):
+    """
+    Pool positions of every row's few-shot examples for a condition, drawn
+    at once: row i-1 holds TID i's FEW_SHOT_COUNT examples. The matrix covers
+    all TIDs, so shards and resumed runs see the same examples.
+    """
+    return sample_index_matrix(
+        len(resources["few_shot_texts"]),
+        total_posts(cond, resources),
+        FEW_SHOT_COUNT,
+        seed=row_seed(seed, cond["name"], 0),
+    )
+
+
+def few_shot_examples(positions, clips, resources):
+    """
+    Return (example IDs, {ID: kept characters}, example texts) for pool
+    positions; `clips` maps positions of clipped examples to their length.
+    """
+    texts = resources["few_shot_texts"]
+    ids = resources["few_shot_ids"]
+    examples = [texts[p][:clips[p]] if p in clips else texts[p] for p in positions]
+    return [int(ids[p]) for p in positions], {int(ids[p]): chars for p, chars in clips.items()}, examples
+
+
+def assemble_prompt(persona_line, data_prompt, diversity_prompt=None, few_shot_block=None,
+                    few_shot_instruction=None, layout="persona_first"):
+    """
+    Return (prefix, prompt). `persona_first` is the original layout and has
+    no shared prefix. In `prefix_first` the instruction block opens the
+    prompt, so all prompts of a condition (per subreddit for attribute-
+    controlled personas) share it, and the persona, few-shot block and
+    diversity suffix form the per-row tail.
+    """
+    few_shot_section = ""
+    if few_shot_block is not None:
+        few_shot_section = (
+            f"Here are some example comments:\n{few_shot_block}\n\n"
+            f"{few_shot_instruction}\n\n"
+        )
+
+    if layout == "persona_first":
+        body = data_prompt if diversity_prompt is None else f"{data_prompt}\n\n{diversity_prompt}"
+        return None, f"[INST] {persona_line}\n\n{few_shot_section}{body} [/INST]"
+
+    prefix = f"[INST] {data_prompt}\n"
+    tail = f"{persona_line}\n\n{few_shot_section}"
+    if diversity_prompt is not None:
+        tail += diversity_prompt
+    return prefix, f"{prefix}{tail.rstrip()} [/INST]"
+
+
+def condition_templates(cond):
+    """(data prompt template, diversity prompt, few-shot instruction) for a condition."""
+    if cond["persona_type"] == "attribute_controlled":
+        return ATTRIBUTE_TEMPLATES[cond["group"]], ATTRIBUTE_DIVERSITY_PROMPT, ATTRIBUTE_FEW_SHOT_INSTRUCTION
+    return INFERRED_TEMPLATES[cond["group"]], INFERRED_DIVERSITY_PROMPT, INFERRED_FEW_SHOT_INSTRUCTION
+
+
+def total_posts(cond, resources):
+    """Distinct prompts of a condition: the attribute post count or one per inferred persona."""
+    if cond["persona_type"] == "attribute_controlled":
+        return ATTRIBUTE_TOTAL_POSTS
+    return len(resources["personas"][cond["group"]])
+
+
+def sample_tids(prompt_id, samples=1):
+    """TIDs of the `samples` completions of one prompt; with one sample the TID is the prompt ID."""
+    first = (prompt_id - 1) * samples + 1
+    return range(first, first + samples)
+
+
+def row_seed(seed, cond_name, tid):
+    """Per-row seed derived from the global seed; independent of sharding and run order."""
+    digest = hashlib.sha256(f"{seed}:{cond_name}:{tid}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "little")
+
+
+def in_shard(tid, shard):
+    shard_index, shard_count = shard
+    return (tid - 1) % shard_count == shard_index
+
+
+def iter_prompts(cond, resources, seed, layout="persona_first", shard=(0, 1), skip=(), only=None, samples=1):
+    """
+    Yield one prompt entry per post for a condition, in TID order. Only TIDs
+    of the given (index, count) shard are built, TIDs in `skip` are left
+    out and, if given, only TIDs in `only` are kept. Each row reseeds the RNG from `row_seed`, so a TID's prompt does not
+    depend on which other rows are generated.
+
+    With `samples` > 1 each prompt is built once and yielded once per
+    sample TID (see sample_tids), back to back and with its own sampling
+    seed; shards split by prompt so the samples of a prompt stay together.
+
+    With a `prompt_tokenizer` in resources, entries also carry the prompt's
+    token IDs (`prompt_tokens`), which the local backends use as they are.
+    """
+    template, diversity_prompt, few_shot_instruction = condition_templates(cond)
+    tokenizer = resources.get("prompt_tokenizer")
+    if cond["persona_type"] == "inferred":
+        personas = resources["personas"][cond["group"]]
+    if cond["shot"] == "few":
+        few_shot = few_shot_matrix(cond, resources, seed)
+        packer = resources.get("few_shot_packer")
+
+    for i in range(1, total_posts(cond, resources) + 1):
+        if not in_shard(i, shard):
+            continue
+        tids = [tid for tid in sample_tids(i, samples) if tid not in skip and (only is None or tid in only)]
+        if not tids:
+            continue
+        seed_i = row_seed(seed, cond["name"], i)
+        random.seed(seed_i)
+
+        profile = None
+        persona_id = None
+        if cond["persona_type"] == "attribute_controlled":
+            profile = generate_profile(**resources["profile_data"])
+            profile["condition"] = cond["group"]
+            data_prompt = template.format(sub_choice=profile["subreddit"])
+            persona_line = attribute_persona_line(profile, compact=cond["compact_persona"])
+        else:
+            data_prompt = template
+            persona_id = int(personas.index[i - 1])
+            persona_line = inferred_persona_line(personas.iloc[i - 1])
+
+        ptype = "diversity" if i % 5 == 0 else "normal"
+
+        def build(examples):
+            return assemble_prompt(
+                persona_line,
+                data_prompt,
+                diversity_prompt=diversity_prompt if ptype == "diversity" else None,
+                few_shot_block=None if examples is None else format_few_shot_block(examples),
+                few_shot_instruction=few_shot_instruction,
+                layout=layout,
+            )
+
+        few_shot_ids, few_shot_clips, examples = [], {}, None
+        if cond["shot"] == "few":
+            positions, clips = few_shot[i - 1].tolist(), {}
+            if packer is not None:
+                positions, clips, _ = packer.pack(positions, lambda texts: build(texts)[1])
+            few_shot_ids, few_shot_clips, examples = few_shot_examples(positions, clips, resources)
+            examples = examples or None
+
+        prefix, prompt = build(examples)
+        prompt_tokens = tokenizer.encode(prompt) if tokenizer is not None else None
+
+        for tid in tids:
+            yield {
+                "index": tid,
+                "seed": row_seed(seed, cond["name"], tid),
+                "prompt_id": i if samples > 1 else None,
+                "type": ptype,
+                "prompt": prompt,
+                "prompt_tokens": prompt_tokens,
+                "prefix": prefix,
+                "persona_line": persona_line,
+                "profile": profile,
+                "persona_id": persona_id,
+                "few_shot_ids": few_shot_ids,
+                "few_shot_clips": few_shot_clips,
+            }
+
+
+# ================================
+# Model
+# ================================
+def load_model(model_size, tuning_dir=TUNING_DIR, **overrides):
+    """
+    Load a model with LLAMA_DEFAULTS < MODELS < tuning profile < overrides.
+    Without a profile from autotune.py (or with tuning_dir=None) the thread
+    counts are capped at the CPUs this job was given.
+    """
+    params = dict(LLAMA_DEFAULTS)
+    params.update(MODELS[model_size])
+    model_path = os.path.expanduser(overrides.get("model_path", params["model_path"]))
+
+    profile = load_profile(model_path, tuning_dir) if tuning_dir else None
+    if profile is not None:
+        print(f"Using tuning profile {profile['path']}: {profile['params']}")
+        params.update(profile["params"])
+    else:
+        cpus = available_cpus()
+        params["n_threads"] = min(params["n_threads"], cpus)
+        params["n_threads_batch"] = cpus
+
+    params.update(overrides)
+    params["model_path"] = model_path
+    return Llama(**params)
+
+
+def finish_word_budget(out, gen_config):
+    """Cut a completion back to the end of its budgeted sentence; finish_reason becomes "word_budget"."""
+    choice = out["choices"][0]
+    text, cut = apply_word_budget(choice["text"], gen_config.get("word_budget"))
+    if cut or choice["finish_reason"] == "word_budget":
+        choice["text"] = text
+        choice["finish_reason"] = "word_budget"
+    return out
+
+
+def complete(llm, prompt, gen_config, seed=None):
+    """
+    Run one prompt (a string, or its token IDs including BOS) and return the
+    completion dict with llama.cpp timings (and draft counts) attached.
+    """
+    if seed is not None:
+        llm.set_seed(seed)
+    stopping_criteria = None
+    if gen_config.get("word_budget"):
+        n_prompt = len(prompt) if not isinstance(prompt, str) else len(
+            llm.tokenize(prompt.encode("utf-8"), add_bos=True, special=True))
+        stopping_criteria = StoppingCriteriaList([WordBudgetCriteria(llm, n_prompt, gen_config["word_budget"])])
+    draft = llm.draft_model
+    if draft is not None:
+        draft.begin()
+    reset_llama_timings(llm)
+    with contextlib.redirect_stdout(io.StringIO()):
+        out = llm(
+            prompt,
+            max_tokens=gen_config["max_tokens"],
+            temperature=gen_config["temperature"],
+            top_p=gen_config["top_p"],
+            top_k=gen_config["top_k"],
+            repeat_penalty=gen_config["repeat_penalty"],
+            presence_penalty=gen_config["presence_penalty"],
+            frequency_penalty=gen_config["frequency_penalty"],
+            stop=gen_config["stop"],
+            stopping_criteria=stopping_criteria,
+            **sampling_constraints(llm, gen_config),
+        )
+    attach_llama_timings(llm, out)
+    if draft is not None:
+        out["speculative"] = draft.counts()
+    return out
+
+
+def generate(llm, prompt, gen_config, seed=None):
+    """Return (text, metrics) for one prompt; see run_metrics.METRIC_COLUMNS."""
+    started = time.perf_counter()
+    try:
+        out = finish_word_budget(complete(llm, prompt, gen_config, seed=seed), gen_config)
+        return out["choices"][0]["text"].strip(), completion_metrics(out, elapsed_ms(started))
+    except Exception as e:
+        return f"[Error: {e}]", error_metrics(elapsed_ms(started))
+
+
+# ================================
+# Output
+# ================================
+# Output column -> generate_profile key
+PROFILE_COLUMNS = {
+    "Age": "age",
+    "Gender": "gender",
+    "Education": "education",
+    "Occupation": "occupation",
+    "Interests": "interests",
+    "Subreddit": "subreddit",
+    "Nationality": "nationality",
+    "Marrital Status": "marital_status",
+    "Condition": "condition",
+}
+
+
+def profile_columns(profile):
+    row = {column: profile[key] for column, key in PROFILE_COLUMNS.items()}
+    row["Interests"] = ', '.join(profile["interests"])
+    return row
+
+
+def build_row(tid, entry, text, gen_config, model_path, metrics=None):
+    """Original wide row: full persona line, prompt and generation settings on every row."""
+    row = {"TID": tid}
+    if entry.get("prompt_id") is not None:
+        row["Prompt ID"] = entry["prompt_id"]
+    if entry["profile"] is not None:
+        row.update(profile_columns(entry["profile"]))
+    row.update({
+        "Persona": entry["persona_line"],
+        "Prompt": entry["prompt"],
+        "Generated Text": text,
+        "max_tokens": gen_config["max_tokens"],
+        "temperature": gen_config["temperature"],
+        "top_p": gen_config["top_p"],
+        "top_k": gen_config["top_k"],
+        "repeat_penalty": gen_config["repeat_penalty"],
+        "presence_penalty": gen_config["presence_penalty"],
+        "frequency_penalty": gen_config["frequency_penalty"],
+        "stop": str(gen_config["stop"]),
+        "word_budget": gen_config.get("word_budget"),
+        "model": os.path.basename(model_path)
+    })
+    if metrics is not None:
+        row.update(metrics)
+    return row
+
+
+def manifest_row(tid, entry, text, metrics=None):
+    """
+    Row for the manifest format: the persona reference (profile columns or
+    row of the persona file), few-shot example IDs and the text. Prompt and
+    settings live once in the run manifest; see reconstruct_prompt.
+    """
+    row = {"TID": tid}
+    if entry.get("prompt_id") is not None:
+        row["Prompt ID"] = entry["prompt_id"]
+    if entry["profile"] is not None:
+        row.update(profile_columns(entry["profile"]))
+    else:
+        row["Persona ID"] = entry["persona_id"]
+    row.update({
+        "Prompt Type": entry["type"],
+        "Few-Shot IDs": format_few_shot_ids(entry["few_shot_ids"], entry["few_shot_clips"]),
+        "Generated Text": text,
+    })
+    if metrics is not None:
+        row.update(metrics)
+    return row
+
+
+def output_row(output_format, entry, text, gen_config, model_path, metrics=None):
+    if output_format == "manifest":
+        return manifest_row(entry["index"], entry, text, metrics)
+    return build_row(entry["index"], entry, text, gen_config, model_path, metrics)
+
+
+def build_manifest(cond, gen_config, model_path, seed, layout, shard=(0, 1), packer=None, samples=1):
+    """Everything shared by the rows of one run, enough to rebuild each prompt."""
+    template, diversity_prompt, few_shot_instruction = condition_templates(cond)
+    few_shot = cond["shot"] == "few"
+    return {
+        "condition": cond["name"],
+        "persona_type": cond["persona_type"],
+        "shot": cond["shot"],
+        "group": cond["group"],
+        "model_size": cond["model_size"],
+        "compact_persona": cond["compact_persona"],
+        "model": os.path.basename(model_path),
+        "gen_config": dict(gen_config),
+        "seed": seed,
+        "layout": layout,
+        "shard_index": shard[0],
+        "shard_count": shard[1],
+        "samples_per_prompt": samples,
+        "templates": {
+            "data_prompt": template,
+            "diversity_prompt": diversity_prompt,
+            "few_shot_instruction": few_shot_instruction if few_shot else None,
+        },
+        "persona_file": PERSONA_FILES[cond["group"]] if cond["persona_type"] == "inferred" else None,
+        "few_shot_file": FEW_SHOT_FILE if few_shot else None,
+        "prompt_budget": packer.prompt_budget if few_shot and packer is not None else None,
+        "clip_example_tokens": packer.clip_tokens if few_shot and packer is not None else None,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def reconstruct_prompt(row, manifest, sources=None):
+    """
+    Rebuild the exact prompt of a manifest-format row. `sources` caches the
+    persona and few-shot files across calls; pass the same dict for a whole
+    file, as load_output does.
+    """
+    sources = {} if sources is None else sources
+    templates = manifest["templates"]
+
+    if manifest["persona_type"] == "attribute_controlled":
+        profile = {key: row[column] for column, key in PROFILE_COLUMNS.items()}
+        profile["interests"] = [row["Interests"]]
+        data_prompt = templates["data_prompt"].format(sub_choice=row["Subreddit"])
+        persona_line = attribute_persona_line(profile, compact=manifest["compact_persona"])
+    else:
+        path = manifest["persona_file"]
+        if path not in sources:
+            sources[path] = pd.read_csv(path)["Generated_persona"]
+        data_prompt = templates["data_prompt"]
+        persona_line = inferred_persona_line(sources[path].loc[int(row["Persona ID"])])
+
+    few_shot_block = None
+    if manifest["few_shot_file"] and not pd.isna(row["Few-Shot IDs"]):
+        path = manifest["few_shot_file"]
+        if path not in sources:
+            sources[path] = pd.read_csv(path)["text"]
+        ids, clips = parse_few_shot_ids(row["Few-Shot IDs"])
+        examples = [sources[path].loc[i][:clips[i]] if i in clips else sources[path].loc[i] for i in ids]
+        few_shot_block = format_few_shot_block(examples)
+
+    _, prompt = assemble_prompt(
+        persona_line,
+        data_prompt,
+        diversity_prompt=templates["diversity_prompt"] if row["Prompt Type"] == "diversity" else None,
+        few_shot_block=few_shot_block,
+        few_shot_instruction=templates["few_shot_instruction"],
+        layout=manifest["layout"],
+    )
+    return prompt
+
+
+def load_output(path, with_prompts=False):
+    """
+    Read a generated CSV. For manifest-format outputs the manifest is
+    returned alongside and with_prompts adds the rebuilt `Prompt` column.
+    """
+    # A lone example ID would otherwise be parsed as a number
+    df = pd.read_csv(path, dtype={"Few-Shot IDs": str})
+    manifest = load_manifest(path)
+    if manifest is not None and with_prompts:
+        sources = {}
+        df["Prompt"] = [reconstruct_prompt(row, manifest, sources) for row in df.to_dict("records")]
+    return df, manifest
+
+
+# ================================
+# Run
+# ================================
+def backend_completions(llm, entries, gen_config, batcher=None, prefix_cache=None):
+    """
+    Yield (entry, completion dict) pairs; a failed completion is
+    {"error": message}. Without a batcher prompts run one at a time in
+    order, restoring each prompt's shared prefix from the prefix cache when
+    one is given; with a batcher they arrive in completion order.
+    """
+    if batcher is not None:
+        yield from batcher.generate(entries, gen_config)
+        return
+    for entry in entries:
+        if prefix_cache is not None and entry["prefix"]:
+            prefix_cache.prime(entry["prefix"])
+        started = time.perf_counter()
+        prompt = entry["prompt"] if entry.get("prompt_tokens") is None else entry["prompt_tokens"].tolist()
+        try:
+            out = complete(llm, prompt, gen_config, seed=entry["seed"])
+        except Exception as e:
+            out = {"error": str(e) or type(e).__name__}
+        out["latency_ms"] = elapsed_ms(started)
+        yield entry, out
+
+
+def iter_completions(llm, entries, gen_config, batcher=None, prefix_cache=None, cache=None):
+    """
+    Yield (entry, text, metrics) triples from backend_completions, answering
+    requests already in the generation cache from there when one is given.
+    """
+    def run(pending):
+        return backend_completions(llm, pending, gen_config, batcher=batcher, prefix_cache=prefix_cache)
+
+    completions = run(entries) if cache is None else cache.complete(entries, gen_config, run)
+    for entry, out in completions:
+        if "error" in out:
+            yield entry, f"[Error: {out['error']}]", error_metrics(out.get("latency_ms"))
+        else:
+            finish_word_budget(out, gen_config)
+            yield entry, out["choices"][0]["text"].strip(), completion_metrics(out, out.get("latency_ms"))
+
+
+def plan_buckets(batcher, entries, gen_config, n_buckets, max_parallel=None):
+    """
+    Tokenize the prompts and split them into length buckets for a
+    BatchedGenerator: [(n_ctx_per_seq, n_parallel, entries)]. The KV cache
+    the batcher was created with is divided into as many sequences of each
+    bucket's context as fit, up to max_parallel (default: no more than now).
+    """
+    lengths = [
+        len(entry["prompt_tokens"]) if entry.get("prompt_tokens") is not None
+        else len(batcher.llm.tokenize(entry["prompt"].encode("utf-8"), add_bos=True, special=True))
+        for entry in entries
+    ]
+    n_parallel = batcher.kv_tokens // batcher.max_ctx_per_seq
+    buckets = length_buckets(entries, lengths, gen_config["max_tokens"], batcher.max_ctx_per_seq, n_buckets=n_buckets)
+    return [
+        (n_ctx, parallel_for(n_ctx, batcher.kv_tokens, n_parallel, max_parallel or n_parallel, len(bucket)), bucket)
+        for n_ctx, bucket in buckets
+    ]
+
+
+def bucketed_completions(llm, buckets, gen_config, batcher, cache=None):
+    """iter_completions over plan_buckets' buckets, resizing the batcher's context for each one."""
+    try:
+        for n_ctx, n_parallel, entries in buckets:
+            batcher.resize(n_ctx, n_parallel)
+            yield from iter_completions(llm, entries, gen_config, batcher=batcher, cache=cache)
+    finally:
+        batcher.resize(batcher.max_ctx_per_seq, batcher.kv_tokens // batcher.max_ctx_per_seq)
+
+
+def resolve_seed(outfn, seed=None, resume=False):
+    """
+    Global seed for a condition. A resumed run reuses the seed recorded next
+    to the output so the remaining rows get the prompts they would have had.
+    Tasks of one Slurm array share SLURM_ARRAY_JOB_ID, which is used when no
+    seed is given so all shards agree.
+    """
+    state = load_state(outfn) if resume else None
+    if state is not None:
+        if seed is not None and seed != state["seed"]:
+            print(f"Ignoring --seed {seed}: resuming {outfn} with its recorded seed {state['seed']}")
+        return state["seed"]
+    if seed is None and os.environ.get("SLURM_ARRAY_JOB_ID"):
+        seed = int(os.environ["SLURM_ARRAY_JOB_ID"])
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    return seed
+
+
+def shard_output_path(path, shard):
+    shard_index, shard_count = shard
+    if shard_count == 1:
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.shard-{shard_index:03d}-of-{shard_count:03d}{ext}"
+
+
+def run_condition(llm, cond, resources, model_path, gen_config=GEN_CONFIG, output_dir=".", batcher=None,
+                  layout="persona_first", prefix_cache=None, resume=False, seed=None, flush_every=25,
+                  shard=(0, 1), output_format="manifest", pipeline=False, queue_size=64, dedup_threshold=None,
+                  generation_cache=None, samples_per_prompt=1, ctx_buckets=None, max_parallel=None,
+                  sort_window=PREFIX_SORT_WINDOW):
+    print(f"\n[START] {cond['name']} | {cond['model_size']} | shard {shard[0] + 1}/{shard[1]}")
+    outfn = shard_output_path(os.path.join(output_dir, cond["output"]), shard)
+    os.makedirs(output_dir, exist_ok=True)
+
+    done = set()
+    if resume:
+        done = completed_tids(outfn)
+        print(f"Resuming {outfn}: {len(done)} rows already completed")
+        previous = load_state(outfn)
+        if done and previous is not None:
+            # Keep appending in the format, samples per prompt, layout and
+            # generation settings the file was started with
+            output_format = previous.get("output_format", "wide")
+            samples_per_prompt = previous.get("samples_per_prompt", 1)
+            if previous.get("layout", layout) != layout:
+                print(f"Ignoring --layout {layout}: resuming {outfn} with its recorded layout {previous['layout']}")
+                layout = previous["layout"]
+            manifest = load_manifest(outfn)
+            recorded = manifest["gen_config"] if manifest is not None else previous.get("gen_config")
+            if recorded is not None and recorded != gen_config:
+                print(f"Ignoring the generation settings given now: resuming {outfn} with its recorded ones")
+                gen_config = recorded
+    else:
+        for path in (outfn, manifest_path(outfn), duplicates_path(outfn)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    seed = resolve_seed(outfn, seed=seed, resume=resume)
+    state = {
+        "seed": seed,
+        "condition": cond["name"],
+        "model": os.path.basename(model_path),
+        "layout": layout,
+        "shard_index": shard[0],
+        "shard_count": shard[1],
+        "total_posts": total_posts(cond, resources) * samples_per_prompt,
+        "samples_per_prompt": samples_per_prompt,
+        "output_format": output_format,
+        "gen_config": dict(gen_config),
+        "complete": False,
+    }
+    save_state(outfn, state)
+    if output_format == "manifest":
+        save_manifest(outfn, build_manifest(cond, gen_config, model_path, seed, layout, shard=shard,
+                                            packer=resources.get("few_shot_packer"), samples=samples_per_prompt))
+
+    # Counters shared across conditions start from zero for this one
+    if resources.get("few_shot_packer") is not None:
+        resources["few_shot_packer"].reset_counts()
+    if prefix_cache is not None:
+        prefix_cache.reset_counts()
+    if generation_cache is not None:
+        generation_cache.reset_counts()
+    if isinstance(batcher, BatchedGenerator):
+        batcher.forks = 0
+
+    start = datetime.now()
+    n_prompts = sum(1 for i in range(1, total_posts(cond, resources) + 1) if in_shard(i, shard)
+                    for tid in sample_tids(i, samples_per_prompt) if tid not in done)
+    prompts = iter_prompts(cond, resources, seed, layout=layout, shard=shard, skip=done, samples=samples_per_prompt)
+    if pipeline:
+        # Build prompts in a background thread just ahead of the model and
+        # write rows from another; prompts run in TID order.
+        prompts = prefetch(prompts, maxsize=queue_size)
+        writer = ThreadedWriter(CheckpointWriter(outfn, flush_every=flush_every), maxsize=queue_size)
+    else:
+        if layout == "prefix_first":
+            # Run prompts sharing a prefix back to back so each prefix is
+            # evaluated once, holding no more than a window of them
+            prompts = sorted_windows(prompts, lambda entry: entry["prefix"], sort_window)
+        writer = CheckpointWriter(outfn, flush_every=flush_every)
+
+    duplicates = None
+    if dedup_threshold is not None:
+        # Check each comment against everything generated so far as it arrives
+        duplicates = DuplicateTracker(dedup_threshold)
+        if done:
+            previous_rows = read_verbatim(outfn)
+            for tid, text in zip(previous_rows["TID"].astype(int), previous_rows["Generated Text"]):
+                duplicates.add(tid, text)
+
+    if ctx_buckets and isinstance(batcher, BatchedGenerator) and not pipeline and n_prompts:
+        # Run similar lengths together, each with no more KV cache per sequence
+        # than they need; sorting by length needs every prompt up front
+        prompts = list(prompts)
+        buckets = plan_buckets(batcher, prompts, gen_config, ctx_buckets, max_parallel=max_parallel)
+        for n_ctx, n_parallel, bucket in buckets:
+            print(f"Length bucket: {len(bucket)} prompt(s), {n_parallel} x {n_ctx} tokens of KV cache")
+        completions = bucketed_completions(llm, buckets, gen_config, batcher, cache=generation_cache)
+    else:
+        completions = iter_completions(llm, prompts, gen_config, batcher=batcher, prefix_cache=prefix_cache,
+                                       cache=generation_cache)
+    progress = tqdm(completions, total=n_prompts, desc=f"Generating {cond['name']}")
+    with writer:
+        for n, (entry, text, metrics) in enumerate(progress):
+            if n == 0:
+                print(f"\nFirst completion after {datetime.now() - start}")
+            writer.write(output_row(output_format, entry, text, gen_config, model_path, metrics))
+            if duplicates is not None and duplicates.add(entry["index"], text):
+                progress.set_postfix(near_duplicates=len(duplicates))
+
+    end = datetime.now()
+    print(f"\nDone in {end - start}")
+    if prefix_cache is not None:
+        print(f"Prefix cache: {prefix_cache.stats()}")
+    if generation_cache is not None:
+        print(f"Generation cache: {generation_cache.stats()}")
+    if samples_per_prompt > 1 and isinstance(batcher, BatchedGenerator):
+        print(f"Prompt KV cache copied into {batcher.forks} sample sequence(s)")
+    if cond["shot"] == "few" and resources.get("few_shot_packer") is not None:
+        print(f"Few-shot packing: {resources['few_shot_packer'].stats()}")
+
+    sort_by_tid(outfn)
+    if duplicates is not None:
+        write_duplicates(outfn, duplicates.frame())
+    state["complete"] = True
+    save_state(outfn, state)
+    print(f"Saved {len(done) + writer.rows_written} rows to {outfn}")
+
+    summary = summarize_output(outfn, wall_seconds=(end - start).total_seconds())
+    if summary is not None and summary["latency_ms"] is not None:
+        print(f"Latency p50 {summary['latency_ms']['p50']:.0f} ms, p95 {summary['latency_ms']['p95']:.0f} ms | "
+              f"{summary['total_completion_tokens']} completion tokens | finish reasons {summary['finish_reasons']}")
+    if summary is not None and "speculative" in summary:
+        spec = summary["speculative"]
+        print(f"Speculative decoding: {spec['accepted_draft_tokens']}/{spec['draft_tokens']} draft tokens accepted"
+              + (f" ({spec['acceptance_rate']:.0%})" if spec["acceptance_rate"] is not None else ""))
+    return outfn
+
+
+def load_draft(args):
+    """The draft_model hook for --speculative, or None."""
+    if args.speculative is None:
+        return None
+    if args.speculative == "prompt_lookup":
+        print(f"Speculative decoding: prompt lookup, up to {args.draft_tokens} tokens per draft")
+        return PromptLookupDraft(args.draft_tokens, max_ngram_size=args.lookup_ngram)
+    if args.draft_model is None:
+        raise ValueError("--speculative draft_model needs --draft-model <path to a small GGUF of the same family>")
+    print(f"Speculative decoding: draft model {args.draft_model}, up to {args.draft_tokens} tokens per draft")
+    return DraftModel.load(args.draft_model, args.draft_tokens, n_ctx=args.n_ctx or LLAMA_DEFAULTS["n_ctx"],
+                           n_threads=min(LLAMA_DEFAULTS["n_threads"], available_cpus()),
+                           n_gpu_layers=args.draft_gpu_layers)
+
+
+def build_packer(llm, batcher, resources, gen_config, prompt_budget=None, clip_tokens=None):
+    """
+    Few-shot packer using the backend's tokenizer. The default budget is the
+    per-sequence context minus max_tokens and one BOS token.
+    """
+    if llm is not None:
+        n_ctx = batcher.n_ctx_per_seq if batcher is not None else llm.n_ctx()
+        prompt_tokenizer = resources.get("prompt_tokenizer")
+
+        def tokenize(text):
+            if prompt_tokenizer is not None:
+                return prompt_tokenizer.encode(text, add_bos=False).tolist()
+            return llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+
+        def detokenize(tokens):
+            return llm.detokenize(tokens).decode("utf-8", errors="ignore")
+    else:
+        n_ctx = batcher.n_ctx()
+        tokenize, detokenize = batcher.tokenize, batcher.detokenize
+
+    if prompt_budget is None:
+        if n_ctx is None:
+            print("Few-shot packing off: the server did not report its context size (set --prompt-budget)")
+            return None
+        prompt_budget = n_ctx - gen_config["max_tokens"] - 1
+    print(f"Packing few-shot examples into {prompt_budget} prompt tokens")
+    return FewShotPacker(tokenize, detokenize, resources["few_shot_texts"], prompt_budget, clip_tokens=clip_tokens)
+
+
+def regenerate_condition(llm, cond, resources, model_path, gen_config=GEN_CONFIG, output_dir=".", batcher=None,
+                         prefix_cache=None, flush_every=25, shard=(0, 1), generation_cache=None, overrides=None):
+    """
+    Re-run only the TIDs in the output's failure file (validate_outputs.py)
+    and swap the new rows in place. Prompts are rebuilt from the recorded
+    seed, so personas and few-shot examples stay the same; sampling uses a
+    fresh seed, row_seed(seed, "<condition>#<attempt>", tid), and the
+    attempt number is stored in the Attempt column.
+
+    Sampling settings are the run's own (from its manifest or state, else
+    `gen_config`), with `overrides` (the constraint flags given now: word
+    budget, stops, banned terms, grammar) applied on top and recorded with
+    the attempt.
+    """
+    outfn = shard_output_path(os.path.join(output_dir, cond["output"]), shard)
+    failed = load_failed_tids(outfn)
+    if not failed:
+        print(f"No failed rows listed for {outfn}")
+        return outfn
+    state = load_state(outfn)
+    if state is None or not state["complete"]:
+        raise ValueError(f"{outfn} is not a finished run; finish it with --resume before regenerating rows")
+
+    manifest = load_manifest(outfn)
+    if manifest is not None:
+        gen_config = manifest["gen_config"]
+    elif "gen_config" in state:
+        gen_config = state["gen_config"]
+    overrides = overrides or {}
+    gen_config = dict(gen_config, **overrides)
+    attempt = state.get("regenerations", 0) + 1
+    print(f"\n[REGENERATE] {cond['name']} | {len(failed)} row(s) | attempt {attempt}")
+
+    entries = []
+    for entry in iter_prompts(cond, resources, state["seed"], layout=state["layout"], shard=shard, only=failed,
+                              samples=state.get("samples_per_prompt", 1)):
+        entry["seed"] = row_seed(state["seed"], f"{cond['name']}#{attempt}", entry["index"])
+        entries.append(entry)
+
+    regen_path = f"{outfn}.regen.csv"
+    if os.path.exists(regen_path):
+        os.remove(regen_path)
+    output_format = state.get("output_format", "wide")
+    completions = iter_completions(llm, entries, gen_config, batcher=batcher, prefix_cache=prefix_cache,
+                                   cache=generation_cache)
+    with CheckpointWriter(regen_path, flush_every=flush_every) as writer:
+        for entry, text, metrics in tqdm(completions, total=len(entries), desc=f"Regenerating {cond['name']}"):
+            row = output_row(output_format, entry, text, gen_config, model_path, metrics)
+            row["Attempt"] = attempt
+            writer.write(row)
+
+    replaced = replace_rows(outfn, regen_path)
+    os.remove(regen_path)
+    os.remove(failures_path(outfn))
+    record = {"attempt": attempt, "rows": replaced, "gen_config_overrides": overrides}
+    state["regenerations"] = attempt
+    state.setdefault("regeneration_attempts", []).append(record)
+    save_state(outfn, state)
+    if manifest is not None:
+        manifest.setdefault("regenerations", []).append(record)
+        save_manifest(outfn, manifest)
+    summarize_output(outfn)
+    print(f"Replaced {replaced} row(s) in {outfn}; run validate_outputs.py again to check them")
+    return outfn
+
+
+def shard_from_env():
+    """(index, count) of this Slurm array task, or (0, 1) outside an array job."""
+    if "SLURM_ARRAY_TASK_ID" not in os.environ:
+        return 0, 1
+    task_id = int(os.environ["SLURM_ARRAY_TASK_ID"])
+    task_min = int(os.environ.get("SLURM_ARRAY_TASK_MIN", 0))
+    count = int(os.environ.get("SLURM_ARRAY_TASK_COUNT", 1))
+    return task_id - task_min, count
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run every generation condition for one model, loading the model only once."
+    )
+    parser.add_argument("--model", choices=sorted(MODELS), required=True)
+    parser.add_argument("--conditions", nargs="+", default=None,
+                        help="Condition names to run (default: the full matrix), e.g. mdd_atb_few ctrl_inf_zero")
+    parser.add_argument("--model-path", default=None, help="Override the GGUF path for --model")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--backend", choices=("local", "server", "worker"), default="local",
+                        help="local loads the GGUF in-process; server sends prompts to a running llama.cpp server; "
+                             "worker uses the model held by a running model_worker.py")
+    parser.add_argument("--server-url", default="http://127.0.0.1:8080",
+                        help="Base URL of the OpenAI-compatible llama.cpp server (--backend server)")
+    parser.add_argument("--worker-socket", default=DEFAULT_SOCKET,
+                        help="Unix socket of model_worker.py (--backend worker)")
+    parser.add_argument("--parallel", type=int, default=1,
+                        help="Sequences decoded together in one llama.cpp context (continuous batching), "
+                             "or requests in flight with --backend server")
+    parser.add_argument("--n-ctx", type=int, default=None,
+                        help=f"Context of the model, one sequence at a time (default: {LLAMA_DEFAULTS['n_ctx']})")
+    parser.add_argument("--n-ctx-per-seq", type=int, default=None,
+                        help="KV cache tokens per parallel sequence (default: --n-ctx)")
+    parser.add_argument("--ctx-buckets", type=int, default=None,
+                        help="With --parallel: tokenize each condition's prompts first, sort them by length and run "
+                             "them in this many buckets, each with a KV cache per sequence sized to its longest "
+                             "prompt + max_tokens instead of the full n_ctx")
+    parser.add_argument("--max-parallel", type=int, default=None,
+                        help="With --ctx-buckets, run up to this many sequences when shorter contexts leave room in "
+                             "the KV cache of --parallel x n_ctx (default: --parallel)")
+    parser.add_argument("--layout", choices=PROMPT_LAYOUTS, default="persona_first",
+                        help="prefix_first puts the shared instruction block first so it can be cached")
+    parser.add_argument("--sort-window", type=int, default=PREFIX_SORT_WINDOW,
+                        help="prefix_first: regroup prompts by prefix within runs of this many, so memory stays "
+                             "bounded (0: the whole condition at once)")
+    parser.add_argument("--prefix-cache-mb", type=int, default=2048,
+                        help="In-memory budget for cached prefix states (prefix_first layout only)")
+    parser.add_argument("--prefix-cache-dir", default=None,
+                        help="Also persist prefix states here so later runs can reuse them")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep existing output rows, skip their TIDs and replay the recorded seed")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for persona and few-shot sampling (recorded next to each output)")
+    parser.add_argument("--flush-every", type=int, default=25,
+                        help="Rows per fsync'd write to the output CSV")
+    parser.add_argument("--shard-index", type=int, default=None,
+                        help="This job's shard (default: from SLURM_ARRAY_TASK_ID)")
+    parser.add_argument("--shard-count", type=int, default=None,
+                        help="Total shards (default: SLURM_ARRAY_TASK_COUNT); merge with merge_shards.py")
+    parser.add_argument("--samples-per-prompt", type=int, default=1,
+                        help="Completions sampled from each prompt, one row each with a shared Prompt ID; the prompt "
+                             "is evaluated once and its KV cache reused (copied across sequences with --parallel)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Build prompts lazily in a producer thread and write rows from a writer thread while "
+                             "the model runs (prompts stay in TID order, so prefix_first does not regroup them)")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="Prompts built ahead of the model / rows waiting to be written with --pipeline")
+    parser.add_argument("--prompt-budget", type=int, default=None,
+                        help="Max prompt tokens when packing few-shot examples (default: n_ctx - max_tokens)")
+    parser.add_argument("--clip-example-tokens", type=int, default=None,
+                        help="Cut few-shot examples longer than this many tokens at a word boundary")
+    parser.add_argument("--no-packing", action="store_true",
+                        help="Always use all sampled few-shot examples, even if the prompt overflows n_ctx")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="manifest",
+                        help="manifest: one <output>.manifest.json per run and compact rows (prompts can be rebuilt "
+                             "with load_output); wide: prompt and settings repeated on every row")
+    parser.add_argument("--word-budget", type=int, default=None,
+                        help="Stop each comment at the end of the sentence after this many words, e.g. 80")
+    parser.add_argument("--stop-preambles", action="store_true",
+                        help="Also stop at titles, notes, word counts or hashtag lines following the comment")
+    parser.add_argument("--ban-terms", nargs="*", default=None,
+                        help="Never sample these words or phrases, in any case (no value: the terms "
+                             "validate_outputs.py rejects). Local and worker backends")
+    parser.add_argument("--ban-bias", type=float, default=None,
+                        help="Add this logit bias to banned terms instead of blocking them, e.g. -10")
+    parser.add_argument("--grammar", default=None,
+                        help=f"Constrain completions with a GBNF grammar: {', '.join(sorted(GRAMMARS))} "
+                             "(one paragraph of plain text) or a .gbnf file. Not with the local --parallel > 1")
+    parser.add_argument("--regenerate", action="store_true",
+                        help="Only re-run the rows listed by validate_outputs.py and replace them in place")
+    parser.add_argument("--cache-db", default=None,
+                        help="SQLite file of earlier completions keyed by model, prompt, settings and seed; "
+                             "identical requests are answered from it instead of the model")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MB,
+                        help="Drop the least recently used cached completions beyond this size")
+    parser.add_argument("--dedup-threshold", type=float, default=None,
+                        help="Flag comments whose word 3-gram similarity to an earlier one is at least this "
+                             "(e.g. 0.7) while generating; listed in <output>.duplicates.csv")
+    parser.add_argument("--regenerate-duplicates", action="store_true",
+                        help="After each condition, regenerate the rows flagged by --dedup-threshold once")
+    parser.add_argument("--speculative", choices=SPECULATIVE_MODES, default=None,
+                        help="Speculative decoding (local backend, --parallel 1): prompt_lookup drafts tokens by "
+                             "matching the last n-gram against the prompt; draft_model runs --draft-model ahead")
+    parser.add_argument("--draft-model", default=None,
+                        help="Small GGUF with the target's vocabulary, e.g. a Llama 3 8B/1B for the Llama 3 70B")
+    parser.add_argument("--draft-tokens", type=int, default=DEFAULT_DRAFT_TOKENS,
+                        help="Most tokens proposed per draft")
+    parser.add_argument("--lookup-ngram", type=int, default=DEFAULT_LOOKUP_NGRAM,
+                        help="Longest n-gram matched against the prompt with --speculative prompt_lookup")
+    parser.add_argument("--draft-gpu-layers", type=int, default=-1,
+                        help="Layers of the draft model to offload (-1: all, ignored on CPU-only builds)")
+    parser.add_argument("--token-cache-dir", default=TOKEN_CACHE_DIR,
+                        help="Token IDs of recurring prompt pieces (templates, few-shot examples) per tokenizer, "
+                             "reused by later runs (local backend)")
+    parser.add_argument("--no-token-cache", action="store_true",
+                        help="Tokenize every prompt string in full instead of assembling prompts from cached pieces")
+    parser.add_argument("--tuning-dir", default=TUNING_DIR,
+                        help="Where autotune.py keeps per-(model, host) Llama parameter profiles")
+    parser.add_argument("--no-tuning-profile", action="store_true",
+                        help="Ignore tuning profiles and use the built-in Llama parameters")
+    parser.add_argument("--list", action="store_true", help="Print the condition matrix and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    conditions = select_conditions(args.model, args.conditions)
+
+    if args.list:
+        for cond in conditions:
+            print(f"{cond['name']:<16} -> {cond['output']}")
+        return
+
+    shard = shard_from_env()
+    if args.shard_count is not None:
+        shard = (args.shard_index or 0, args.shard_count)
+    elif args.shard_index is not None:
+        shard = (args.shard_index, shard[1])
+    if not 0 <= shard[0] < shard[1]:
+        raise ValueError(f"Shard index {shard[0]} out of range for {shard[1]} shard(s)")
+    if args.ctx_buckets and (args.backend != "local" or args.parallel < 2 or args.pipeline):
+        raise ValueError("--ctx-buckets resizes the local backend's batched KV cache: use --parallel > 1 and no "
+                         "--pipeline")
+    if args.n_ctx and args.backend == "server":
+        raise ValueError("--n-ctx has no effect on llama-server; start it with -c <tokens per slot x --parallel>")
+    if args.n_ctx_per_seq and (args.backend != "local" or args.parallel < 2):
+        raise ValueError("--n-ctx-per-seq sizes the local backend's batched sequences: use it with --parallel > 1")
+    if args.samples_per_prompt < 1:
+        raise ValueError("--samples-per-prompt must be at least 1")
+    if args.speculative and args.backend != "local":
+        raise ValueError("--speculative is for the local backend; start llama-server with --model-draft instead")
+    if args.speculative and args.parallel > 1:
+        raise ValueError("--speculative decodes one sequence at a time; drop --parallel")
+    if args.ban_terms is not None and args.backend == "server":
+        raise ValueError("--ban-terms needs the local or worker backend; llama-server only takes per-token biases")
+    if args.grammar and args.backend == "local" and args.parallel > 1:
+        raise ValueError("--grammar samples one sequence at a time on the local backend; drop --parallel")
+
+    # Output constraints given on the command line; --regenerate applies
+    # them over the sampling settings recorded by the run
+    constraints = {}
+    if args.word_budget is not None:
+        constraints["word_budget"] = args.word_budget
+    if args.stop_preambles:
+        constraints["stop"] = GEN_CONFIG["stop"] + PREAMBLE_STOPS
+    if args.ban_terms is not None:
+        constraints["banned_terms"] = args.ban_terms or FORBIDDEN_TERMS
+        constraints["ban_bias"] = args.ban_bias
+    if args.grammar:
+        constraints["grammar"] = load_grammar(args.grammar)
+    gen_config = dict(GEN_CONFIG, **constraints)
+
+    overrides = {"model_path": args.model_path} if args.model_path else {}
+    resources = load_resources(conditions)
+
+    llm = None
+    batcher = None
+    if args.backend == "server":
+        batcher = ServerBackend(args.server_url, concurrency=args.parallel)
+        model_path = batcher.model_name() or args.model_path or MODELS[args.model]["model_path"]
+        print(f"Sending {len(conditions)} condition(s) to {args.server_url} with {args.parallel} request(s) in flight")
+    elif args.backend == "worker":
+        batcher = WorkerBackend(args.worker_socket)
+        load_start = datetime.now()
+        model_path = batcher.load(args.model, args.model_path, n_ctx=args.n_ctx)
+        print(f"Using {model_path} from the model worker at {args.worker_socket} ({datetime.now() - load_start})")
+    else:
+        print(f"Loading {args.model} model once for {len(conditions)} condition(s)...")
+        load_start = datetime.now()
+        draft = load_draft(args)
+        if draft is not None:
+            # Llama sizes its logits buffer from the logits_all argument, which it
+            # does not turn on for a draft_model by itself
+            overrides.update(draft_model=draft, logits_all=True)
+        n_ctx = args.n_ctx or MODELS[args.model].get("n_ctx", LLAMA_DEFAULTS["n_ctx"])
+        if args.parallel > 1:
+            # Sequences get the batcher's own KV cache; the model's context
+            # is never decoded on, so it only needs to hold one batch
+            overrides["n_ctx"] = DEFAULT_N_BATCH
+        elif args.n_ctx:
+            overrides["n_ctx"] = args.n_ctx
+        llm = load_model(args.model, tuning_dir=None if args.no_tuning_profile else args.tuning_dir, **overrides)
+        model_path = llm.model_path
+        if isinstance(draft, DraftModel):
+            check_vocab(llm, draft.llm)
+        print(f"Model loaded in {datetime.now() - load_start}")
+
+        if args.parallel > 1:
+            batcher = BatchedGenerator(llm, n_parallel=args.parallel, n_ctx_per_seq=args.n_ctx_per_seq or n_ctx)
+
+    if llm is not None and not args.no_token_cache:
+        resources["prompt_tokenizer"] = PromptTokenizer(llm, cache_dir=args.token_cache_dir)
+
+    if any(c["shot"] == "few" for c in conditions) and not args.no_packing:
+        resources["few_shot_packer"] = build_packer(llm, batcher, resources, gen_config, args.prompt_budget,
+                                                    args.clip_example_tokens)
+
+    prefix_cache = None
+    if args.layout == "prefix_first" and batcher is None and llm is not None:
+        prefix_cache = PrefixCache(llm, capacity_bytes=args.prefix_cache_mb << 20, cache_dir=args.prefix_cache_dir)
+
+    generation_cache = None
+    if args.cache_db:
+        generation_cache = GenerationCache(args.cache_db, model_path, max_bytes=args.cache_max_mb << 20)
+
+    for cond in conditions:
+        try:
+            if args.regenerate:
+                regenerate_condition(llm, cond, resources, model_path, gen_config=gen_config,
+                                     output_dir=args.output_dir, batcher=batcher, prefix_cache=prefix_cache,
+                                     flush_every=args.flush_every, shard=shard, generation_cache=generation_cache,
+                                     overrides=constraints)
+                continue
+            outfn = run_condition(llm, cond, resources, model_path, gen_config=gen_config,
+                                  output_dir=args.output_dir, batcher=batcher, layout=args.layout,
+                                  prefix_cache=prefix_cache, resume=args.resume, seed=args.seed,
+                                  flush_every=args.flush_every, shard=shard, output_format=args.output_format,
+                                  pipeline=args.pipeline, queue_size=args.queue_size,
+                                  dedup_threshold=args.dedup_threshold, generation_cache=generation_cache,
+                                  samples_per_prompt=args.samples_per_prompt, ctx_buckets=args.ctx_buckets,
+                                  max_parallel=args.max_parallel, sort_window=args.sort_window)
+            if args.regenerate_duplicates and args.dedup_threshold is not None:
+                duplicates = pd.read_csv(duplicates_path(outfn))
+                if len(duplicates):
+                    save_failures(outfn, pd.DataFrame({"TID": duplicates["TID"], "failed_checks": "near_duplicates"}))
+                    regenerate_condition(llm, cond, resources, model_path, gen_config=gen_config,
+                                         output_dir=args.output_dir, batcher=batcher, prefix_cache=prefix_cache,
+                                         flush_every=args.flush_every, shard=shard,
+                                         generation_cache=generation_cache, overrides=constraints)
+        except Exception as e:
+            print(f"Error in condition {cond['name']}: {e}")
+
+    if "prompt_tokenizer" in resources:
+        resources["prompt_tokenizer"].save()
+        print(f"Prompt tokenizer: {resources['prompt_tokenizer'].stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import json
+import socket
+
+TUNING_DIR = "./tuning_profiles"
+TUNED_PARAMS = ("n_threads", "n_threads_batch", "n_batch", "n_ubatch", "n_gpu_layers")
+
+
+def available_cpus():
+    """CPUs this process may use: its affinity mask, capped by SLURM_CPUS_PER_TASK."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    if os.environ.get("SLURM_CPUS_PER_TASK"):
+        cpus = min(cpus, int(os.environ["SLURM_CPUS_PER_TASK"]))
+    return max(1, cpus)
+
+
+def host_name():
+    return socket.gethostname().split(".")[0]
+
+
+def profile_path(model_path, tuning_dir=TUNING_DIR, cpus=None):
+    """One profile per model file, host and CPU allocation."""
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    cpus = cpus or available_cpus()
+    return os.path.join(tuning_dir, f"{stem}.{host_name()}.{cpus}cpu.json")
+
+
+def load_profile(model_path, tuning_dir=TUNING_DIR):
+    """The tuned profile for this model on this host, or None if missing or stale."""
+    path = profile_path(model_path, tuning_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        profile = json.load(f)
+    if profile.get("model_bytes") != os.path.getsize(model_path):
+        print(f"Ignoring tuning profile {path}: it was made for a different {os.path.basename(model_path)}")
+        return None
+    profile["path"] = path
+    return profile
+
+
+def save_profile(model_path, params, results, tuning_dir=TUNING_DIR):
+    path = profile_path(model_path, tuning_dir)
+    os.makedirs(tuning_dir, exist_ok=True)
+    profile = {
+        "model": os.path.basename(model_path),
+        "model_bytes": os.path.getsize(model_path),
+        "host": host_name(),
+        "cpus": available_cpus(),
+        "params": {key: params[key] for key in TUNED_PARAMS},
+        "results": results,
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+import os
+import re
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+
+from hardware_profile import available_cpus
+
+CHUNK_SIZE = 2000
+
+# ================================
+# Lexicons
+# ================================
+# Word lists in the spirit of CYMO/LIWC categories. A trailing * matches any
+# word starting with the stem.
+PRONOUNS = {
+    "pronoun_i": "i me my mine myself i'm i've i'd i'll im ive",
+    "pronoun_we": "we us our ours ourselves we're we've we'd we'll",
+    "pronoun_you": "you your yours yourself yourselves you're you've you'd you'll u ur",
+    "pronoun_shehe": "she her hers herself he him his himself she's he's she'd he'd",
+    "pronoun_they": "they them their theirs themselves they're they've they'd they'll",
+}
+
+LEXICONS = {
+    "negation": "no not never none nobody nothing nowhere neither nor cannot can't don't doesn't didn't won't "
+                "wouldn't isn't aren't wasn't weren't haven't hasn't hadn't shouldn't couldn't dont cant wont",
+    "positive_emotion": "happy happi* joy* love* loving glad great good nice fun* enjoy* excit* awesome amazing "
+                        "wonderful grateful thank* hope* proud laugh* smil* best beautiful calm* relax* peace*",
+    "negative_emotion": "sad* hurt* hate* awful terrible bad worse worst pain* cry* cried upset* lonely alone "
+                        "miserable hopeless* worthless* empty numb tired exhaust* scared afraid angry guilt*",
+    "anxiety": "anxi* worr* nervous* panic* fear* scared afraid stress* tense uneasy overwhelm* dread*",
+    "anger": "angry anger mad hate* annoy* furious rage* frustrat* irritat* pissed hostil*",
+    "sadness": "sad* cry* cried tears grief griev* lonely alone miss* hopeless* depress* unhappy heartbr* sorrow*",
+    "cognitive": "think* thought* know* knew because cause reason* understand* realiz* mean* maybe perhaps "
+                 "consider* believ* wonder* figur* guess*",
+    "certainty": "always never definitely certain* sure absolutely clearly obvious* totally completely "
+                 "undoubtedly",
+    "tentative": "maybe perhaps possibly probably might guess* seem* unsure somewhat kinda sorta",
+    "absolutist": "absolute* all always complete* completely constant* definitely entire* ever every everyone "
+                  "everything full* must never nothing totally whole",
+    "social": "friend* people family talk* told tell* said say* someone everyone anyone together partner* "
+              "wife husband girlfriend boyfriend mom dad parent* kid* son daughter brother sister",
+    "work": "work* job* boss* office career* shift* coworker* colleague* project* deadline* meeting* school "
+            "class* exam* study* college universit* paycheck salary",
+    "leisure": "game* gaming movie* film* music song* read* book* hik* travel* cook* sport* play* hobby* "
+               "weekend vacation*",
+    "body_health": "body sick* ill doctor* hospital* pain* ache* head* tired sleep* eat* ate food appetite "
+                   "weight medic* therap* health*",
+    "sleep": "sleep* slept insomnia nap* bed tired awake wake* woke dream* nightmare*",
+    "death": "death dead die* died dying kill* suicid* funeral grave",
+    "past_focus": "was were had did been ago yesterday used remember* went",
+    "future_focus": "will gonna going soon tomorrow plan* hope* someday future later",
+    "swear": "fuck* shit* damn* hell crap* ass bitch* wtf",
+    "filler": "like um uh basically literally actually honestly anyway lol lmao",
+}
+
+# ================================
+# Text statistics
+# ================================
+WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+SENTENCE_RE = r"[.!?]+(?:\s|$)"
+VOWEL_GROUPS_RE = re.compile(r"[aeiouy]+")
+
+SURFACE_FEATURES = [
+    "n_chars", "n_words", "n_sentences", "words_per_sentence", "chars_per_word", "long_word_ratio",
+    "type_token_ratio", "hapax_ratio", "exclamation_ratio", "question_ratio", "comma_ratio", "ellipsis_count",
+    "uppercase_ratio", "digit_ratio", "newline_count",
+]
+READABILITY_FEATURES = [
+    "syllables_per_word", "polysyllable_ratio", "flesch_reading_ease", "flesch_kincaid_grade", "gunning_fog",
+]
+PRONOUN_FEATURES = list(PRONOUNS) + ["pronoun_total", "first_person_share"]
+FEATURE_NAMES = SURFACE_FEATURES + READABILITY_FEATURES + PRONOUN_FEATURES + list(LEXICONS)
+
+
+def syllables(word):
+    """Vowel-group syllable estimate; a silent final e does not count."""
+    word = word.replace("'", "")
+    count = len(VOWEL_GROUPS_RE.findall(word))
+    if word.endswith("e") and not word.endswith(("le", "ee")) and count > 1:
+        count -= 1
+    return max(count, 1)
+
+
+def _category_matcher(categories):
+    """(exact word -> category columns, stem -> category columns, stem lengths) for a lexicon dict."""
+    exact, stems = {}, {}
+    for column, words in enumerate(categories.values()):
+        for word in words.split():
+            if word.endswith("*"):
+                stems.setdefault(word[:-1], set()).add(column)
+            else:
+                exact.setdefault(word, set()).add(column)
+    return exact, stems, sorted({len(stem) for stem in stems})
+
+
+CATEGORIES = dict(PRONOUNS, **LEXICONS)
+_MATCHER = _category_matcher(CATEGORIES)
+
+
+def category_matrix(vocab):
+    """Sparse (len(vocab), len(CATEGORIES)) 0/1 matrix of the categories each vocabulary word belongs to."""
+    exact, stems, stem_lengths = _MATCHER
+    rows, cols = [], []
+    for row, word in enumerate(vocab):
+        columns = set(exact.get(word, ()))
+        for length in stem_lengths:
+            if length <= len(word):
+                columns |= stems.get(word[:length], set())
+        rows.extend([row] * len(columns))
+        cols.extend(columns)
+    data = np.ones(len(rows), dtype=np.float32)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(len(vocab), len(CATEGORIES)))
+
+
+def document_term_matrix(texts):
+    """(CSR word counts, vocabulary) for a list of texts, lower-cased and tokenized with WORD_RE."""
+    vocab = {}
+    indices, indptr = [], [0]
+    for text in texts:
+        words = WORD_RE.findall(text.lower().replace("’", "'"))
+        indices.extend(vocab.setdefault(word, len(vocab)) for word in words)
+        indptr.append(len(indices))
+    counts = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+        shape=(len(texts), len(vocab)),
+    )
+    counts.sum_duplicates()
+    return counts, list(vocab)
+
+
+def _ratio(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator, dtype=np.float64), where=denominator > 0)
+
+
+def featurize(texts):
+    """float32 matrix (len(texts), len(FEATURE_NAMES)) for one chunk of texts."""
+    texts = pd.Series(texts, dtype=object).fillna("").astype(str).reset_index(drop=True)
+    counts, vocab = document_term_matrix(texts.tolist())
+
+    word_lengths = np.fromiter((len(w) for w in vocab), dtype=np.float64, count=len(vocab))
+    word_syllables = np.fromiter((syllables(w) for w in vocab), dtype=np.float64, count=len(vocab))
+    n_words = np.asarray(counts.sum(axis=1), dtype=np.float64).ravel()
+    n_types = np.diff(counts.indptr).astype(np.float64)
+    n_hapax = np.bincount(np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))[counts.data == 1],
+                          minlength=counts.shape[0]).astype(np.float64)
+    total_chars_in_words = counts @ word_lengths
+    total_syllables = counts @ word_syllables
+    long_words = counts @ (word_lengths > 6).astype(np.float64)
+    polysyllables = counts @ (word_syllables >= 3).astype(np.float64)
+
+    n_chars = texts.str.len().to_numpy(dtype=np.float64)
+    n_sentences = np.maximum(texts.str.count(SENTENCE_RE).to_numpy(dtype=np.float64), (n_words > 0).astype(float))
+    letters = texts.str.count(r"[A-Za-z]").to_numpy(dtype=np.float64)
+
+    words_per_sentence = _ratio(n_words, n_sentences)
+    syllables_per_word = _ratio(total_syllables, n_words)
+    polysyllable_ratio = _ratio(polysyllables, n_words)
+    has_words = n_words > 0
+
+    surface = [
+        n_chars,
+        n_words,
+        n_sentences,
+        words_per_sentence,
+        _ratio(total_chars_in_words, n_words),
+        _ratio(long_words, n_words),
+        _ratio(n_types, n_words),
+        _ratio(n_hapax, n_words),
+        _ratio(texts.str.count("!").to_numpy(dtype=np.float64), n_sentences),
+        _ratio(texts.str.count(r"\?").to_numpy(dtype=np.float64), n_sentences),
+        _ratio(texts.str.count(",").to_numpy(dtype=np.float64), n_words),
+        texts.str.count(r"\.\.\.|…").to_numpy(dtype=np.float64),
+        _ratio(texts.str.count(r"[A-Z]").to_numpy(dtype=np.float64), letters),
+        _ratio(texts.str.count(r"\d").to_numpy(dtype=np.float64), n_chars),
+        texts.str.count("\n").to_numpy(dtype=np.float64),
+    ]
+    readability = [
+        syllables_per_word,
+        polysyllable_ratio,
+        np.where(has_words, 206.835 - 1.015 * words_per_sentence - 84.6 * syllables_per_word, 0.0),
+        np.where(has_words, 0.39 * words_per_sentence + 11.8 * syllables_per_word - 15.59, 0.0),
+        np.where(has_words, 0.4 * (words_per_sentence + 100.0 * polysyllable_ratio), 0.0),
+    ]
+
+    category_counts = (counts @ category_matrix(vocab)).toarray().astype(np.float64)
+    category_ratios = _ratio(category_counts, n_words[:, None])
+    n_pronoun_types = len(PRONOUNS)
+    pronoun_counts = category_counts[:, :n_pronoun_types]
+    pronoun_total = pronoun_counts.sum(axis=1)
+    pronouns = [category_ratios[:, i] for i in range(n_pronoun_types)] + [
+        _ratio(pronoun_total, n_words),
+        _ratio(pronoun_counts[:, 0], pronoun_total),
+    ]
+    lexicon = [category_ratios[:, i] for i in range(n_pronoun_types, len(CATEGORIES))]
+
+    return np.column_stack(surface + readability + pronouns + lexicon).astype(np.float32)
+
+
+def featurize_texts(texts, workers=None, chunk_size=CHUNK_SIZE):
+    """FEATURE_NAMES matrix for any number of texts, chunks featurized in a process pool."""
+    texts = list(texts)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if not chunks:
+        return np.zeros((0, len(FEATURE_NAMES)), dtype=np.float32)
+    if workers == 1 or len(chunks) == 1:
+        return np.vstack([featurize(chunk) for chunk in chunks])
+    with ProcessPoolExecutor(max_workers=workers or available_cpus()) as pool:
+        return np.vstack(list(pool.map(featurize, chunks)))
+
+
+# ================================
+# Files
+# ================================
+def feature_paths(path, output_dir=None):
+    """(ann.<name>.csv, <name>.features.npy, <name>.features.json) next to the input or in output_dir."""
+    directory = output_dir or os.path.dirname(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return (os.path.join(directory, f"ann.{stem}.csv"),
+            os.path.join(directory, f"{stem}.features.npy"),
+            os.path.join(directory, f"{stem}.features.json"))
+
+
+def text_column(columns, preferred=None):
+    for column in ([preferred] if preferred else ["Generated Text", "text", "body"]):
+        if column in columns:
+            return column
+    raise ValueError(f"No text column found among {list(columns)}; pass --text-column")
+
+
+def featurize_file(path, output_dir=None, column=None, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Featurize one CSV of texts. Writes the float32 matrix as .npy (with a
+    .json listing columns, source and TIDs) and `ann.<name>.csv`, the
+    numeric-only layout the evaluation scripts read CYMO output from.
+    """
+    df = pd.read_csv(path, keep_default_na=False)
+    column = text_column(df.columns, column)
+    features = featurize_texts(df[column].tolist(), workers=workers, chunk_size=chunk_size)
+
+    ann_path, npy_path, meta_path = feature_paths(path, output_dir)
+    os.makedirs(os.path.dirname(ann_path) or ".", exist_ok=True)
+    np.save(npy_path, features)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "source": path,
+            "text_column": column,
+            "columns": FEATURE_NAMES,
+            "tids": df["TID"].tolist() if "TID" in df.columns else None,
+        }, f, indent=2)
+    pd.DataFrame(features, columns=FEATURE_NAMES).to_csv(ann_path, index=False, float_format="%.6g")
+    print(f"{path}: {features.shape[0]} texts x {features.shape[1]} features -> {ann_path}, {npy_path}")
+    return features
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compute CYMO-like linguistic features (lexicon ratios, readability, surface statistics, "
+                    "pronoun ratios) for CSVs of texts."
+    )
+    parser.add_argument("inputs", nargs="+", help="Generated or real CSV files")
+    parser.add_argument("--output-dir", default=None, help="Default: next to each input")
+    parser.add_argument("--text-column", default=None, help="Default: Generated Text, text or body")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: one per allocated CPU)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Texts per task")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for path in args.inputs:
+        featurize_file(path, args.output_dir, args.text_column, workers=args.workers, chunk_size=args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
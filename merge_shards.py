@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+import os
+import glob
+import argparse
+import pandas as pd
+
+from checkpoint_writer import load_manifest, load_state, read_verbatim, save_manifest, save_state, write_verbatim
+from run_metrics import summarize_output
+from generation_engine import MODELS, select_conditions
+
+
+def find_shards(output_path):
+    stem, ext = os.path.splitext(output_path)
+    return sorted(glob.glob(f"{glob.escape(stem)}.shard-*-of-*{ext}"))
+
+
+def merge_shards(output_path, shard_paths=None, allow_missing=False):
+    """
+    Concatenate shard outputs into the canonical file in TID order.
+    Fails on duplicate TIDs, shards from different seeds and, unless
+    allow_missing is set, on TIDs missing from 1..total_posts.
+    """
+    shard_paths = shard_paths or find_shards(output_path)
+    if not shard_paths:
+        raise FileNotFoundError(f"No shard files found for {output_path}")
+
+    states = [load_state(path) for path in shard_paths]
+    seeds = {state["seed"] for state in states if state is not None}
+    if len(seeds) > 1:
+        raise ValueError(f"Shards were generated with different seeds: {sorted(seeds)}")
+    counts = {state["shard_count"] for state in states if state is not None}
+    if len(counts) > 1:
+        raise ValueError(f"Shards come from different shard counts: {sorted(counts)}")
+    incomplete = [path for path, state in zip(shard_paths, states) if state is not None and not state["complete"]]
+    if incomplete and not allow_missing:
+        raise ValueError(f"Unfinished shard(s), rerun them with --resume: {', '.join(incomplete)}")
+    if counts and len(shard_paths) != next(iter(counts)) and not allow_missing:
+        raise ValueError(f"Found {len(shard_paths)} of {next(iter(counts))} shards for {output_path}")
+
+    df = pd.concat([read_verbatim(path) for path in shard_paths], ignore_index=True).fillna("")
+    tids = df["TID"].astype(int)
+
+    duplicated = tids[tids.duplicated()].unique().tolist()
+    if duplicated:
+        raise ValueError(f"Duplicate TIDs across shards: {duplicated[:20]}")
+
+    totals = {state["total_posts"] for state in states if state is not None}
+    expected = max(totals) if totals else int(tids.max())
+    missing = sorted(set(range(1, expected + 1)) - set(tids))
+    if missing:
+        message = f"{len(missing)} TID(s) missing from the merged output, e.g. {missing[:20]}"
+        if not allow_missing:
+            raise ValueError(message)
+        print(f"Warning: {message}")
+
+    df = df.iloc[tids.argsort(kind="stable")]
+    write_verbatim(df, output_path)
+
+    state = dict(states[0]) if states[0] is not None else {}
+    state.update({"shard_index": 0, "shard_count": 1, "merged_from": shard_paths, "complete": not missing})
+    save_state(output_path, state)
+    manifest = load_manifest(shard_paths[0])
+    if manifest is not None:
+        manifest.update({"shard_index": 0, "shard_count": 1})
+        save_manifest(output_path, manifest)
+    summarize_output(output_path)
+    print(f"Merged {len(shard_paths)} shard(s), {len(df)} rows -> {output_path}")
+    return output_path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Merge sharded generation outputs into the canonical per-condition CSV."
+    )
+    parser.add_argument("--model", choices=sorted(MODELS), required=True)
+    parser.add_argument("--conditions", nargs="+", default=None,
+                        help="Condition names to merge (default: every condition with shard files)")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="Write the merged file even if shards or TIDs are missing")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for cond in select_conditions(args.model, args.conditions):
+        output_path = os.path.join(args.output_dir, cond["output"])
+        if not find_shards(output_path):
+            if args.conditions:
+                print(f"No shards found for {cond['name']} ({output_path})")
+            continue
+        merge_shards(output_path, allow_missing=args.allow_missing)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import time
+import random
+import uuid
+import numpy as np
+
+WORDS = (
+    "i the a and to of it my was that in just for this but so you is have on with not like me be at "
+    "they what all about out when can think get really one time know day people work would even because "
+    "more now still some back only how go been going much then our made week last year home good thing "
+    "feel never always friends trying little right honestly pretty long new"
+).split()
+
+# Token IDs below this are reserved (unk, bos, eos)
+FIRST_WORD_ID = 3
+
+
+class MockLlama:
+    """
+    Drop-in stand-in for llama_cpp.Llama covering what generation_engine
+    uses: __call__ returns a completion dict with usage and server-style
+    timings, and tokenize/detokenize map one whitespace word to one token.
+
+    The text is deterministic in (seed, prompt): `completion_words` words in
+    sentences of about a dozen, so stop strings, max_tokens and word-budget
+    stopping criteria behave as with a model. `latency` seconds per call
+    plus the optional prompt/decode token rates are slept to imitate a
+    model's speed; with the defaults a call costs almost nothing, which is
+    what pipeline overhead benchmarks want.
+    """
+
+    def __init__(self, model_path="mock.gguf", n_ctx=2048, completion_words=80, latency=0.0,
+                 prompt_tokens_per_sec=None, decode_tokens_per_sec=None, seed=0):
+        self.model_path = model_path
+        self._n_ctx = n_ctx
+        self.completion_words = completion_words
+        self.latency = latency
+        self.prompt_tokens_per_sec = prompt_tokens_per_sec
+        self.decode_tokens_per_sec = decode_tokens_per_sec
+        self.draft_model = None
+        self._seed = seed
+        self._ids = {}
+        self._words = []
+        self.calls = 0
+        self.slept = 0.0
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def set_seed(self, seed):
+        self._seed = seed
+
+    def _token(self, word):
+        token = self._ids.get(word)
+        if token is None:
+            token = self._ids[word] = FIRST_WORD_ID + len(self._words)
+            self._words.append(word)
+        return token
+
+    def tokenize(self, text, add_bos=True, special=False):
+        tokens = [self._token(word) for word in text.decode("utf-8", errors="ignore").split()]
+        return [1] + tokens if add_bos else tokens
+
+    def detokenize(self, tokens, prev_tokens=None, special=False):
+        words = [self._words[t - FIRST_WORD_ID] for t in tokens if t >= FIRST_WORD_ID]
+        return " ".join(words).encode("utf-8")
+
+    def completion_words_for(self, prompt):
+        rng = random.Random(f"{self._seed}\n{prompt}")
+        words = []
+        while len(words) < self.completion_words:
+            sentence = rng.choices(WORDS, k=rng.randint(6, 18))
+            sentence[0] = sentence[0].capitalize()
+            sentence[-1] += "."
+            words.extend(sentence)
+        return words[:self.completion_words]
+
+    def __call__(self, prompt, max_tokens=16, stop=None, stopping_criteria=None, **sampling):
+        self.calls += 1
+        prompt_tokens = self.tokenize(prompt.encode("utf-8"), add_bos=True)
+        words = self.completion_words_for(prompt)[:max_tokens]
+        finish_reason = "length" if len(words) == max_tokens else "stop"
+
+        if stopping_criteria is not None:
+            ids = prompt_tokens + [self._token(word) for word in words]
+            for n in range(1, len(words) + 1):
+                if stopping_criteria(np.array(ids[:len(prompt_tokens) + n], dtype=np.intc), None):
+                    words, finish_reason = words[:n], "stop"
+                    break
+
+        text = " " + " ".join(words)
+        for s in stop or []:
+            cut = text.find(s)
+            if cut >= 0:
+                text, finish_reason = text[:cut], "stop"
+
+        prompt_ms = 1000.0 * len(prompt_tokens) / self.prompt_tokens_per_sec if self.prompt_tokens_per_sec else 0.0
+        decode_ms = 1000.0 * len(words) / self.decode_tokens_per_sec if self.decode_tokens_per_sec else 0.0
+        delay = self.latency + (prompt_ms + decode_ms) / 1000.0
+        if delay > 0:
+            time.sleep(delay)
+            self.slept += delay
+
+        return {
+            "id": f"cmpl-{uuid.uuid4()}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": self.model_path,
+            "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": len(prompt_tokens),
+                "completion_tokens": len(words),
+                "total_tokens": len(prompt_tokens) + len(words),
+            },
+            "timings": {
+                "prompt_n": len(prompt_tokens),
+                "prompt_ms": prompt_ms,
+                "predicted_n": len(words),
+                "predicted_ms": decode_ms,
+            },
+        }
+
+    def close(self):
+        pass
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+import os
+import json
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+from datetime import datetime
+
+from generation_engine import LLAMA_DEFAULTS, MODELS, complete, load_model
+from hardware_profile import TUNING_DIR
+from worker_backend import DEFAULT_SOCKET
+
+
+class ModelWorker:
+    """
+    Loaded Llama instances keyed by GGUF path and context size, shared by
+    every client of one model_worker.py process. Each model serves one
+    completion at a time; clients of different models run concurrently.
+    """
+
+    def __init__(self, tuning_dir=TUNING_DIR):
+        self.tuning_dir = tuning_dir
+        self.models = {}
+        self._load_lock = threading.Lock()
+        self.ops = {
+            "load": self.load,
+            "unload": self.unload,
+            "status": self.status,
+            "complete": self.complete,
+            "tokenize": self.tokenize,
+            "detokenize": self.detokenize,
+            "n_ctx": self.n_ctx,
+        }
+
+    @staticmethod
+    def model_path(model_size, model_path=None):
+        return os.path.abspath(os.path.expanduser(model_path or MODELS[model_size]["model_path"]))
+
+    @staticmethod
+    def model_key(path, n_ctx):
+        return f"{path} (n_ctx {n_ctx})"
+
+    def load(self, model_size, model_path=None, n_ctx=None):
+        """
+        Load a model with `n_ctx` tokens of context (default: the model
+        entry's) unless it is already held; returns {"model": key to send
+        with later calls, "model_path": GGUF path}.
+        """
+        path = self.model_path(model_size, model_path)
+        n_ctx = n_ctx or MODELS[model_size].get("n_ctx", LLAMA_DEFAULTS["n_ctx"])
+        key = self.model_key(path, n_ctx)
+        with self._load_lock:
+            if key not in self.models:
+                print(f"Loading {key}...")
+                started = datetime.now()
+                llm = load_model(model_size, tuning_dir=self.tuning_dir, model_path=path, n_ctx=n_ctx)
+                self.models[key] = {
+                    "llm": llm,
+                    "model_path": path,
+                    "lock": threading.Lock(),
+                    "loaded_at": started.isoformat(timespec="seconds"),
+                    "completions": 0,
+                }
+                print(f"Loaded {key} in {datetime.now() - started}")
+        return {"model": key, "model_path": path}
+
+    def _model(self, model):
+        if model not in self.models:
+            raise KeyError(f"Model {model} is not loaded in this worker")
+        return self.models[model]
+
+    def unload(self, model):
+        with self._load_lock:
+            slot = self.models.pop(model, None)
+        if slot is not None:
+            with slot["lock"]:
+                slot["llm"].close()
+        return slot is not None
+
+    def status(self):
+        return [
+            {"model": key, "n_ctx": slot["llm"].n_ctx(), "loaded_at": slot["loaded_at"],
+             "completions": slot["completions"]}
+            for key, slot in list(self.models.items())
+        ]
+
+    def complete(self, model, prompt, gen_config, seed=None):
+        slot = self._model(model)
+        with slot["lock"]:
+            out = complete(slot["llm"], prompt, gen_config, seed=seed)
+            slot["completions"] += 1
+        return out
+
+    def tokenize(self, model, text):
+        llm = self._model(model)["llm"]
+        return llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+
+    def detokenize(self, model, tokens):
+        llm = self._model(model)["llm"]
+        return llm.detokenize(tokens).decode("utf-8", errors="ignore")
+
+    def n_ctx(self, model):
+        return self._model(model)["llm"].n_ctx()
+
+    def handle(self, request):
+        request = dict(request)
+        op = request.pop("op")
+        if op not in self.ops:
+            raise ValueError(f"Unknown op {op!r}")
+        return self.ops[op](**request)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = {"ok": True, "result": self.server.worker.handle(json.loads(line))}
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class WorkerServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, worker):
+        self.worker = worker
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o600)
+
+
+def claim_socket(socket_path):
+    """Remove a socket file left by a worker that is gone; refuse if one is still listening."""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.remove(socket_path)
+    else:
+        raise RuntimeError(f"A model worker is already listening on {socket_path}")
+    finally:
+        probe.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Keep GGUF models loaded and serve generation jobs over a Unix socket "
+                    "(generation_engine.py --backend worker)."
+    )
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--preload", nargs="*", choices=sorted(MODELS), default=[],
+                        help="Models to load before accepting jobs")
+    parser.add_argument("--model-path", default=None, help="Override the GGUF path of a single --preload model")
+    parser.add_argument("--tuning-dir", default=TUNING_DIR)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    worker = ModelWorker(tuning_dir=args.tuning_dir)
+    for model_size in args.preload:
+        worker.load(model_size, args.model_path if len(args.preload) == 1 else None)
+
+    claim_socket(args.socket)
+    # Treat SIGTERM (scancel, end of the job) like Ctrl-C so the socket file is removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with WorkerServer(args.socket, worker) as server:
+        print(f"Model worker listening on {args.socket}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import os
+import re
+import zlib
+import argparse
+import numpy as np
+import pandas as pd
+
+# Hash arithmetic is done modulo a prime below 2^31 so (a * x + b) fits in uint64
+PRIME = np.uint64((1 << 31) - 1)
+NUM_PERM = 128
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.7
+
+
+def lsh_bands(num_perm, threshold):
+    """(bands, rows) with bands * rows == num_perm whose S-curve midpoint (1/b)^(1/r) is closest to threshold."""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1.0 / br[0]) ** (1.0 / br[1]) - threshold))
+
+
+class MinHasher:
+    """MinHash signatures over lower-cased word n-gram shingles."""
+
+    def __init__(self, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        words = re.findall(r"\w+", text.lower())
+        k = self.shingle_size
+        grams = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)) % PRIME
+
+    def signature(self, text):
+        x = self.shingles(text)
+        return ((np.outer(self.a, x) + self.b[:, None]) % PRIME).min(axis=1)
+
+
+class LSHIndex:
+    """
+    Near-duplicate index: MinHash signatures split into bands, each band
+    hashed into a bucket table. An insert only compares against texts that
+    share a bucket, so its cost depends on the number of near matches, not
+    on the index size. Candidates are confirmed by their estimated Jaccard
+    similarity (fraction of equal signature slots).
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=1):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def query(self, text=None, signature=None):
+        """[(key, estimated similarity)] of indexed texts at or above the threshold, most similar first."""
+        signature = self.hasher.signature(text) if signature is None else signature
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        matches = []
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= self.threshold:
+                matches.append((key, similarity))
+        return sorted(matches, key=lambda match: -match[1])
+
+    def insert(self, key, text):
+        """Index a text and return its matches among the texts indexed before it."""
+        signature = self.hasher.signature(text)
+        matches = self.query(signature=signature)
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        return matches
+
+
+def skip_text(text):
+    return not isinstance(text, str) or not text.strip() or text.startswith("[Error:")
+
+
+class DuplicateTracker:
+    """
+    LSHIndex plus clustering: add() texts one at a time (e.g. as they are
+    generated) and frame() lists every text that matched an earlier one,
+    with clusters joining all texts connected by a match, named by their
+    first key.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.index = LSHIndex(threshold)
+        self._parent = {}
+        self._order = {}
+        self._rows = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _root(self, key):
+        parent = self._parent
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def add(self, key, text):
+        """Index one text; returns its matches among earlier texts (errors and empty texts are ignored)."""
+        if skip_text(text):
+            return []
+        self._parent[key], self._order[key] = key, len(self._order)
+        matches = self.index.insert(key, text)
+        for other, _ in matches:
+            first, second = sorted((self._root(key), self._root(other)), key=self._order.get)
+            self._parent[second] = first
+        if matches:
+            self._rows.append({"key": key, "duplicate_of": matches[0][0], "similarity": matches[0][1]})
+        return matches
+
+    def frame(self):
+        df = pd.DataFrame(self._rows, columns=["key", "duplicate_of", "similarity"])
+        df["cluster"] = [self._root(key) for key in df["key"]]
+        return df
+
+
+def find_duplicates(keys, texts, threshold=DEFAULT_THRESHOLD):
+    """Offline pass over a whole output; see DuplicateTracker.frame for the result."""
+    tracker = DuplicateTracker(threshold)
+    for key, text in zip(keys, texts):
+        tracker.add(key, text)
+    return tracker.frame()
+
+
+def duplicate_mask(texts, threshold=DEFAULT_THRESHOLD):
+    """Boolean array, True for texts that near-duplicate an earlier text."""
+    index = LSHIndex(threshold)
+    mask = np.zeros(len(texts), dtype=bool)
+    for i, text in enumerate(texts):
+        if not skip_text(text):
+            mask[i] = bool(index.insert(i, text))
+    return mask
+
+
+def duplicates_path(output_path):
+    return f"{output_path}.duplicates.csv"
+
+
+def write_duplicates(output_path, duplicates):
+    """Write duplicate rows of one output as <csv>.duplicates.csv (TID, duplicate_of, similarity, cluster)."""
+    duplicates = duplicates.rename(columns={"key": "TID"})
+    duplicates.to_csv(duplicates_path(output_path), index=False)
+    n_clusters = duplicates["cluster"].nunique()
+    print(f"{output_path}: {len(duplicates)} near-duplicate row(s) in {n_clusters} cluster(s) "
+          f"-> {duplicates_path(output_path)}")
+    return duplicates
+
+
+def scan_output(path, threshold=DEFAULT_THRESHOLD):
+    df = pd.read_csv(path, usecols=["TID", "Generated Text"], keep_default_na=False)
+    return write_duplicates(path, find_duplicates(df["TID"].tolist(), df["Generated Text"].tolist(), threshold))
+
+
+def parse_args(argv=None):
+    from generation_engine import MODELS
+
+    parser = argparse.ArgumentParser(description="Report near-duplicate generated comments (MinHash + LSH).")
+    parser.add_argument("--model", choices=sorted(MODELS), required=True)
+    parser.add_argument("--conditions", nargs="+", default=None)
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Estimated Jaccard similarity of word 3-gram sets counted as a duplicate")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from generation_engine import select_conditions
+
+    args = parse_args(argv)
+    for cond in select_conditions(args.model, args.conditions):
+        path = os.path.join(args.output_dir, cond["output"])
+        if os.path.exists(path):
+            scan_output(path, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import queue
+import threading
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(items, item, stop):
+    """Blocking put that gives up once `stop` is set; returns False if it gave up."""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(iterable, maxsize=64):
+    """
+    Iterate `iterable` in a background thread, staying at most `maxsize`
+    items ahead of the consumer. Exceptions raised by the producer are
+    re-raised in the consumer; closing the generator stops the producer.
+    """
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(items, item, stop):
+                    return
+            final = _END
+        except BaseException as e:
+            final = _Failure(e)
+        _put(items, final, stop)
+
+    thread = threading.Thread(target=produce, name="prompt-producer", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def sorted_windows(iterable, key, window):
+    """
+    Yield the items of `iterable` sorted by `key` within consecutive runs of
+    `window` items (window 0: all of them), so at most one window is held.
+    """
+    buffer = []
+    for item in iterable:
+        buffer.append(item)
+        if window and len(buffer) >= window:
+            buffer.sort(key=key)
+            yield from buffer
+            buffer = []
+    buffer.sort(key=key)
+    yield from buffer
+
+
+class ThreadedWriter:
+    """
+    Hand rows to a CheckpointWriter running in its own thread, so CSV
+    serialization and fsync do not stall the model. At most `maxsize` rows
+    wait in the queue. Rows queued before close() are always written; a
+    write error is re-raised on the next write() or on close().
+    """
+
+    def __init__(self, writer, maxsize=256):
+        self.writer = writer
+        self._rows = queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="row-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            row = self._rows.get()
+            if row is _END:
+                return
+            if self._error is None:
+                try:
+                    self.writer.write(row)
+                except BaseException as e:
+                    self._error = e
+
+    @property
+    def rows_written(self):
+        return self.writer.rows_written
+
+    def write(self, row):
+        if self._error is not None:
+            raise self._error
+        self._rows.put(row)
+
+    def close(self):
+        self._rows.put(_END)
+        self._thread.join()
+        self.writer.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
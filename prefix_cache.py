@@ -0,0 +1,111 @@
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+
+
+class PrefixCache:
+    """
+    LRU cache of llama.cpp states for evaluated prompt prefixes.
+
+    Before a prompt is generated, `prime(prefix)` makes sure the model's
+    context starts with the prefix: if it already does nothing happens, else
+    the saved state is restored (from memory, then from `cache_dir`), and only
+    on a full miss is the prefix evaluated and saved. Llama.__call__ then
+    reuses the longest matching token prefix and evaluates only the tail.
+
+    `hits`/`disk_hits` count states restored by the cache. A prefix that is
+    still in the context (the previous prompt had it) counts as
+    `context_reuse`, since the cache is not consulted.
+    """
+
+    def __init__(self, llm, capacity_bytes=2 << 30, cache_dir=None):
+        self.llm = llm
+        self.capacity_bytes = capacity_bytes
+        self.cache_dir = cache_dir
+        self._states = OrderedDict()
+        self._size = 0
+        self.reset_counts()
+
+        model_path = os.path.abspath(llm.model_path)
+        stat = os.stat(model_path)
+        self._model_key = f"{model_path}:{stat.st_size}:{llm.n_ctx()}"
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def reset_counts(self):
+        """Zero the hit and miss counters in stats(); cached states are kept."""
+        self.hits = 0
+        self.disk_hits = 0
+        self.context_reuse = 0
+        self.misses = 0
+
+    def _key(self, prefix):
+        return hashlib.sha1(f"{self._model_key}\n{prefix}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.state")
+
+    def _put(self, key, state):
+        if key in self._states:
+            self._size -= self._states.pop(key).llama_state_size
+        self._states[key] = state
+        self._size += state.llama_state_size
+        while self._size > self.capacity_bytes and len(self._states) > 1:
+            _, evicted = self._states.popitem(last=False)
+            self._size -= evicted.llama_state_size
+
+    def _get(self, key):
+        state = self._states.get(key)
+        if state is not None:
+            self._states.move_to_end(key)
+            self.hits += 1
+            return state
+        if self.cache_dir and os.path.exists(self._disk_path(key)):
+            with open(self._disk_path(key), "rb") as f:
+                state = pickle.load(f)
+            self._put(key, state)
+            self.disk_hits += 1
+            return state
+        return None
+
+    def _context_starts_with(self, tokens):
+        n = len(tokens)
+        return self.llm.n_tokens >= n and self.llm.input_ids[:n].tolist() == tokens
+
+    def prime(self, prefix):
+        # The last prefix token can merge with the start of the tail when the
+        # full prompt is tokenized, so it is left for the tail evaluation.
+        tokens = self.llm.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)[:-1]
+        if not tokens:
+            return
+        if self._context_starts_with(tokens):
+            self.context_reuse += 1
+            return
+
+        key = self._key(prefix)
+        state = self._get(key)
+        if state is not None:
+            self.llm.load_state(state)
+            return
+
+        self.misses += 1
+        self.llm.reset()
+        self.llm.eval(tokens)
+        state = self.llm.save_state()
+        self._put(key, state)
+        if self.cache_dir:
+            tmp = self._disk_path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._disk_path(key))
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "context_reuse": self.context_reuse,
+            "misses": self.misses,
+            "entries": len(self._states),
+            "bytes": self._size,
+        }
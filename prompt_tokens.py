@@ -0,0 +1,130 @@
+import os
+import re
+import pickle
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+TOKEN_CACHE_DIR = "token_cache"
+
+# Prompts are cut after a newline that is followed by text. Neither
+# SentencePiece nor the Llama 3 pre-tokenizer merges across such a point,
+# so each piece can be tokenized on its own and the token IDs concatenated.
+SEGMENT_RE = re.compile(r"(?<=\n)(?=\S)")
+# Placed before a piece so it is tokenized as it is in mid-prompt (without
+# the leading space SentencePiece adds at the start of a text)
+ANCHOR = "\n"
+# Encoded prompts compared against a full tokenization: the first few, then every Nth
+VERIFY_FIRST = 16
+VERIFY_EVERY = 1000
+# Pieces seen only once (persona lines, ...) kept in case they recur
+RECENT_PIECES = 4096
+
+
+def tokenizer_hash(llm):
+    """Hash of a model's vocabulary and tokenizer settings; quantizations of one model share it."""
+    digest = hashlib.sha256()
+    for key in sorted(llm.metadata):
+        if key.startswith("tokenizer."):
+            digest.update(f"{key}={llm.metadata[key]}\n".encode("utf-8"))
+    for token in range(llm.n_vocab()):
+        digest.update(llm._model.token_get_text(token).encode("utf-8", errors="surrogatepass") + b"\0")
+    return digest.hexdigest()
+
+
+class PromptTokenizer:
+    """
+    Tokenize prompts by concatenating the token IDs of their pieces (template
+    paragraphs, persona lines, few-shot examples) instead of tokenizing each
+    prompt string in full. Pieces that recur are kept for the whole run,
+    saved to `cache_dir/<tokenizer hash>.pkl` by `save` and loaded again by
+    later runs with the same tokenizer; pieces seen once are held in an LRU
+    of RECENT_PIECES until they recur, so memory does not grow with rows.
+
+    encode() returns an int32 array equal to llm.tokenize(prompt,
+    special=True). Some results are checked against a full tokenization, and
+    after a mismatch every prompt is tokenized in full.
+    """
+
+    def __init__(self, llm, cache_dir=TOKEN_CACHE_DIR):
+        self.llm = llm
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, f"{tokenizer_hash(llm)[:16]}.pkl") if cache_dir else None
+        self._bos = self._tokenize("", add_bos=True)
+        self._anchor = self._tokenize(ANCHOR)
+        self._pieces = {}
+        self._recent = OrderedDict()
+        self.loaded = 0
+        self.encoded = 0
+        self.hits = 0
+        self.misses = 0
+        self.disabled = False
+
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                self._pieces = pickle.load(f)
+            self.loaded = len(self._pieces)
+
+    def _tokenize(self, text, add_bos=False):
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=add_bos, special=True)
+
+    def _piece(self, text, first):
+        key = (first, text)
+        tokens = self._pieces.get(key)
+        if tokens is not None:
+            self.hits += 1
+            return tokens
+        tokens = self._recent.pop(key, None)
+        if tokens is not None:
+            self.hits += 1
+            self._pieces[key] = tokens
+            return tokens
+        self.misses += 1
+        if first:
+            tokens = self._tokenize(text)
+        else:
+            tokens = self._tokenize(ANCHOR + text)
+            n = len(self._anchor) if tokens[:len(self._anchor)] == self._anchor else 0
+            tokens = tokens[n:]
+        tokens = self._recent[key] = np.asarray(tokens, dtype=np.int32)
+        if len(self._recent) > RECENT_PIECES:
+            self._recent.popitem(last=False)
+        return tokens
+
+    def encode(self, text, add_bos=True):
+        self.encoded += 1
+        if self.disabled:
+            return np.asarray(self._tokenize(text, add_bos=add_bos), dtype=np.int32)
+
+        pieces = [self._piece(piece, i == 0) for i, piece in enumerate(SEGMENT_RE.split(text))]
+        if add_bos:
+            pieces.insert(0, np.asarray(self._bos, dtype=np.int32))
+        tokens = np.concatenate(pieces)
+
+        if self.encoded <= VERIFY_FIRST or self.encoded % VERIFY_EVERY == 0:
+            full = self._tokenize(text, add_bos=add_bos)
+            if tokens.tolist() != full:
+                print("Prompt pieces do not tokenize like the full prompt with this tokenizer; tokenizing whole prompts")
+                self.disabled = True
+                return np.asarray(full, dtype=np.int32)
+        return tokens
+
+    def save(self):
+        """Persist the pieces used more than once (and those loaded) for the next run."""
+        if not self.path or self.disabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(self._pieces, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    def stats(self):
+        return {
+            "prompts": self.encoded,
+            "piece_hits": self.hits,
+            "pieces_tokenized": self.misses,
+            "pieces_loaded": self.loaded,
+            "pieces_kept": len(self._pieces),
+            "disabled": self.disabled,
+        }
@@ -0,0 +1,143 @@
+import json
+import time
+import numpy as np
+import pandas as pd
+import llama_cpp
+
+METRIC_COLUMNS = [
+    "prompt_tokens",
+    "prompt_tokens_evaluated",
+    "completion_tokens",
+    "prompt_eval_ms",
+    "decode_ms",
+    "latency_ms",
+    "tokens_per_sec",
+    "finish_reason",
+    "draft_tokens",
+    "accepted_draft_tokens",
+    "cached",
+]
+
+
+def reset_llama_timings(llm):
+    if isinstance(llm, llama_cpp.Llama):
+        llama_cpp.llama_perf_context_reset(llm._ctx.ctx)
+
+
+def attach_llama_timings(llm, out):
+    """
+    Add llama.cpp's perf counters for the last call to a completion, in the
+    `timings` layout llama.cpp's server returns. Tokens reused from the KV
+    cache are not part of prompt_n. Stand-ins such as mock_llama.MockLlama
+    return their own timings and are left alone.
+    """
+    if not isinstance(llm, llama_cpp.Llama):
+        return out
+    perf = llama_cpp.llama_perf_context(llm._ctx.ctx)
+    out["timings"] = {
+        "prompt_n": perf.n_p_eval,
+        "prompt_ms": perf.t_p_eval_ms,
+        "predicted_n": perf.n_eval,
+        "predicted_ms": perf.t_eval_ms,
+    }
+    return out
+
+
+def completion_metrics(out, latency_ms):
+    """
+    Per-row metrics from a completion dict (usage, finish reason and optional
+    timings). Draft counts come from `speculative` (local speculative
+    decoding) or the server's draft_n / draft_n_accepted timings. `cached`
+    marks completions answered from the generation cache.
+    """
+    usage = out.get("usage", {})
+    timings = out.get("timings", {})
+    speculative = out.get("speculative", {})
+    prompt_eval_ms = timings.get("prompt_ms")
+    decode_ms = timings.get("predicted_ms")
+    completion_tokens = usage.get("completion_tokens", timings.get("predicted_n"))
+    tokens_per_sec = None
+    if completion_tokens and decode_ms:
+        tokens_per_sec = completion_tokens / (decode_ms / 1000.0)
+    return {
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "prompt_tokens_evaluated": timings.get("prompt_n"),
+        "completion_tokens": completion_tokens,
+        "prompt_eval_ms": prompt_eval_ms,
+        "decode_ms": decode_ms,
+        "latency_ms": out.get("latency_ms", latency_ms),
+        "tokens_per_sec": tokens_per_sec,
+        "finish_reason": out["choices"][0].get("finish_reason"),
+        "draft_tokens": speculative.get("draft_tokens", timings.get("draft_n")),
+        "accepted_draft_tokens": speculative.get("accepted_draft_tokens", timings.get("draft_n_accepted")),
+        "cached": bool(out.get("cached")),
+    }
+
+
+def error_metrics(latency_ms):
+    metrics = dict.fromkeys(METRIC_COLUMNS)
+    metrics["latency_ms"] = latency_ms
+    metrics["finish_reason"] = "error"
+    metrics["cached"] = False
+    return metrics
+
+
+def elapsed_ms(started):
+    return (time.perf_counter() - started) * 1000.0
+
+
+def _percentiles(series):
+    values = series.dropna().to_numpy(dtype=np.float64)
+    if values.size == 0:
+        return None
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"p50": float(p50), "p95": float(p95), "mean": float(values.mean()), "max": float(values.max())}
+
+
+def summarize_output(path, wall_seconds=None):
+    """
+    Write `<csv>.summary.json` with latency percentiles, token totals and
+    finish reasons for one generated CSV, and return the summary. Rows
+    answered from the generation cache are counted but left out of the
+    timing figures.
+    """
+    df = pd.read_csv(path, usecols=lambda column: column in METRIC_COLUMNS or column == "TID")
+    if "latency_ms" not in df.columns:
+        return None
+
+    cached = df["cached"].fillna(False).astype(bool) if "cached" in df.columns else pd.Series(False, index=df.index)
+    timed = df[~cached]
+    prompt_eval_total = float(timed["prompt_eval_ms"].sum())
+    decode_total = float(timed["decode_ms"].sum())
+    summary = {
+        "output": path,
+        "rows": int(len(df)),
+        "cached_rows": int(cached.sum()),
+        "latency_ms": _percentiles(timed["latency_ms"]),
+        "prompt_eval_ms": _percentiles(timed["prompt_eval_ms"]),
+        "decode_ms": _percentiles(timed["decode_ms"]),
+        "tokens_per_sec": _percentiles(timed["tokens_per_sec"]),
+        "total_prompt_tokens": int(df["prompt_tokens"].fillna(0).sum()),
+        "total_prompt_tokens_evaluated": int(df["prompt_tokens_evaluated"].fillna(0).sum()),
+        "total_completion_tokens": int(df["completion_tokens"].fillna(0).sum()),
+        "finish_reasons": {str(k): int(v) for k, v in df["finish_reason"].value_counts(dropna=False).items()},
+        "prompt_eval_share": (
+            prompt_eval_total / (prompt_eval_total + decode_total) if prompt_eval_total + decode_total > 0 else None
+        ),
+    }
+    if "draft_tokens" in df.columns and df["draft_tokens"].notna().any():
+        drafted = int(df["draft_tokens"].fillna(0).sum())
+        accepted = int(df["accepted_draft_tokens"].fillna(0).sum())
+        summary["speculative"] = {
+            "draft_tokens": drafted,
+            "accepted_draft_tokens": accepted,
+            "acceptance_rate": accepted / drafted if drafted else None,
+        }
+    if wall_seconds:
+        summary["wall_seconds"] = wall_seconds
+        generated_tokens = int(timed["completion_tokens"].fillna(0).sum())
+        summary["completion_tokens_per_wall_sec"] = generated_tokens / wall_seconds
+
+    with open(f"{path}.summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
@@ -0,0 +1,252 @@
+import json
+import time
+import queue
+import asyncio
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+_DONE = object()
+
+# gen_config keys applied by the client after the server returns (see
+# early_stopping.py), not sent as sampling parameters
+CLIENT_SIDE_KEYS = ("word_budget",)
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class ServerBackend:
+    """
+    Client for a local llama.cpp server (`llama-server`, OpenAI-compatible
+    /v1/completions). Requests go over a pool of keep-alive HTTP/1.1
+    connections from one asyncio event loop; at most `concurrency` requests
+    are in flight, which should match the server's `--parallel` slots, and at
+    most `max_pending` prompts are queued ahead of them so a lazy prompt
+    generator is only advanced as fast as the server drains it.
+
+    The gen_config dict is sent as-is apart from CLIENT_SIDE_KEYS: its keys
+    are the server's sampling parameter names. The word budget can only trim
+    the returned text, so it saves no decode time on this backend.
+    """
+
+    def __init__(self, base_url="http://127.0.0.1:8080", concurrency=8, max_pending=None,
+                 timeout=600, endpoint="/v1/completions"):
+        self.base_url = base_url.rstrip("/")
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.max_pending = max_pending or 2 * concurrency
+        self.timeout = timeout
+        self._idle = []
+        # Keep-alive connection of the blocking helpers, shared under a lock
+        self._helper = None
+        self._helper_lock = threading.Lock()
+
+    # ================================
+    # HTTP
+    # ================================
+    async def _acquire(self):
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn.reader.at_eof():
+                return conn
+            conn.close()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return _Connection(reader, writer)
+
+    def _release(self, conn, keep_alive):
+        if keep_alive:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    async def _read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Server closed the connection")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+        else:
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+        keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+        return status, bytes(body), keep_alive
+
+    async def _request(self, method, path, payload=None):
+        data = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        request = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode("latin-1") + data
+
+        # A pooled connection may have been closed by the server while idle;
+        # retry once on a fresh one.
+        for attempt in range(2):
+            conn = await self._acquire()
+            try:
+                conn.writer.write(request)
+                await conn.writer.drain()
+                status, body, keep_alive = await asyncio.wait_for(self._read_response(conn.reader), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if attempt == 1:
+                    raise
+                continue
+            except BaseException:
+                conn.close()
+                raise
+            self._release(conn, keep_alive)
+            if status != 200:
+                raise RuntimeError(f"HTTP {status}: {body[:200].decode('utf-8', errors='replace')}")
+            return json.loads(body)
+
+    async def complete(self, prompt, gen_config, seed=None):
+        payload = {key: value for key, value in gen_config.items() if key not in CLIENT_SIDE_KEYS}
+        payload["prompt"] = prompt
+        if seed is not None:
+            payload["seed"] = seed
+        return await self._request("POST", self.endpoint, payload)
+
+    # ================================
+    # Scheduling
+    # ================================
+    async def _run(self, entries, gen_config, results):
+        pending = asyncio.Queue(maxsize=self.max_pending)
+
+        async def worker():
+            while True:
+                entry = await pending.get()
+                if entry is _DONE:
+                    return
+                started = time.perf_counter()
+                try:
+                    out = await self.complete(entry["prompt"], gen_config, seed=entry.get("seed"))
+                except Exception as e:
+                    out = {"error": str(e) or type(e).__name__}
+                # Includes time queued behind other requests on the server
+                out["latency_ms"] = (time.perf_counter() - started) * 1000.0
+                results.put((entry, out))
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            for entry in entries:
+                await pending.put(entry)
+            for _ in workers:
+                await pending.put(_DONE)
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+            while self._idle:
+                self._idle.pop().close()
+
+    def generate(self, entries, gen_config):
+        """
+        Yield (entry, completion) pairs in completion order, like
+        BatchedGenerator.generate. The event loop runs in a background thread
+        so the caller can stay synchronous.
+        """
+        results = queue.Queue()
+        failure = []
+
+        def run():
+            try:
+                asyncio.run(self._run(entries, gen_config, results))
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                results.put(_DONE)
+
+        thread = threading.Thread(target=run, name="server-backend", daemon=True)
+        thread.start()
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            yield item
+        thread.join()
+        if failure:
+            raise failure[0]
+
+    # ================================
+    # Blocking helpers (prompt building runs outside the event loop)
+    # ================================
+    def _call(self, path, payload=None):
+        """GET (or POST `payload` to) `path` over one keep-alive connection, reconnecting once if it was dropped."""
+        method = "GET" if payload is None else "POST"
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        with self._helper_lock:
+            for attempt in range(2):
+                if self._helper is None:
+                    self._helper = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                try:
+                    self._helper.request(method, path, body=data, headers=headers)
+                    response = self._helper.getresponse()
+                    body = response.read()
+                    break
+                except (http.client.HTTPException, OSError):
+                    self._helper.close()
+                    self._helper = None
+                    if attempt:
+                        raise
+            if response.will_close:
+                self._helper.close()
+                self._helper = None
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}: {body[:200].decode('utf-8', errors='replace')}")
+        return json.loads(body)
+
+    def tokenize(self, text):
+        return self._call("/tokenize", {"content": text, "add_special": False})["tokens"]
+
+    def detokenize(self, tokens):
+        return self._call("/detokenize", {"tokens": list(tokens)})["content"]
+
+    def n_ctx(self):
+        """Per-slot context size reported by /props, or None."""
+        try:
+            return self._call("/props")["default_generation_settings"]["n_ctx"]
+        except Exception:
+            return None
+
+    def model_name(self):
+        async def fetch():
+            try:
+                return await self._request("GET", "/v1/models")
+            finally:
+                while self._idle:
+                    self._idle.pop().close()
+
+        try:
+            return asyncio.run(fetch())["data"][0]["id"]
+        except Exception:
+            return None
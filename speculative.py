@@ -0,0 +1,122 @@
+import numpy as np
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+SPECULATIVE_MODES = ("prompt_lookup", "draft_model")
+DEFAULT_DRAFT_TOKENS = 8
+DEFAULT_LOOKUP_NGRAM = 3
+
+
+class TrackedDraft(LlamaDraftModel):
+    """
+    Base for the draft_model hook of llama_cpp.Llama that counts how many
+    drafted tokens the target model accepts.
+
+    Llama.generate calls the draft with the tokens accepted so far, so each
+    call settles the previous draft: its accepted tokens are the leading ones
+    that match what the target actually produced. A draft still pending when
+    a completion ends (stop string, max_tokens) is not counted. Call begin()
+    before each completion.
+    """
+
+    def __init__(self, num_tokens=DEFAULT_DRAFT_TOKENS):
+        self.num_tokens = num_tokens
+        self._pending = None
+        self.drafted = 0
+        self.accepted = 0
+
+    def propose(self, input_ids):
+        raise NotImplementedError
+
+    def begin(self):
+        self._pending = None
+        self.drafted = 0
+        self.accepted = 0
+
+    def _settle(self, input_ids):
+        start, draft = self._pending
+        self._pending = None
+        actual = input_ids[start:start + len(draft)]
+        mismatch = np.nonzero(actual != draft[:len(actual)])[0]
+        self.drafted += len(draft)
+        self.accepted += int(mismatch[0]) if mismatch.size else len(actual)
+
+    def __call__(self, input_ids, /, **kwargs):
+        if self._pending is not None:
+            self._settle(input_ids)
+        draft = np.asarray(self.propose(input_ids), dtype=np.intc)
+        if len(draft):
+            self._pending = (len(input_ids), draft)
+        return draft
+
+    def counts(self):
+        """{"draft_tokens", "accepted_draft_tokens"} for the current completion."""
+        return {"draft_tokens": self.drafted, "accepted_draft_tokens": self.accepted}
+
+
+class PromptLookupDraft(TrackedDraft):
+    """Draft-free speculation: continue the latest n-gram from an earlier occurrence in the prompt."""
+
+    def __init__(self, num_tokens=DEFAULT_DRAFT_TOKENS, max_ngram_size=DEFAULT_LOOKUP_NGRAM):
+        super().__init__(num_tokens)
+        self.max_ngram_size = max_ngram_size
+
+    def propose(self, input_ids):
+        return LlamaPromptLookupDecoding.find_candidate_pred_tokens(
+            input_ids=input_ids, max_ngram_size=self.max_ngram_size, num_pred_tokens=self.num_tokens,
+        )
+
+
+class DraftModel(TrackedDraft):
+    """
+    Greedy drafts from a smaller GGUF sharing the target's vocabulary. The
+    draft keeps its own KV cache and only evaluates the tokens that differ
+    from what it has already seen.
+    """
+
+    def __init__(self, llm, num_tokens=DEFAULT_DRAFT_TOKENS):
+        super().__init__(num_tokens)
+        self.llm = llm
+
+    @classmethod
+    def load(cls, model_path, num_tokens=DEFAULT_DRAFT_TOKENS, **params):
+        return cls(Llama(model_path=model_path, verbose=False, **params), num_tokens)
+
+    def _common_prefix(self, input_ids):
+        seen = self.llm.input_ids[:min(self.llm.n_tokens, len(input_ids))]
+        mismatch = np.nonzero(seen != input_ids[:len(seen)])[0]
+        return int(mismatch[0]) if mismatch.size else len(seen)
+
+    def _next_token(self):
+        logits = np.ctypeslib.as_array(self.llm._ctx.get_logits_ith(-1), shape=(self.llm.n_vocab(),))
+        return int(np.argmax(logits))
+
+    def propose(self, input_ids):
+        llm = self.llm
+        # Re-evaluate at least the last token so its logits are fresh
+        llm.n_tokens = min(self._common_prefix(input_ids), len(input_ids) - 1)
+        llm.eval(input_ids[llm.n_tokens:].tolist())
+
+        n_draft = min(self.num_tokens, llm.n_ctx() - len(input_ids) - 1)
+        draft = []
+        while len(draft) < n_draft:
+            token = self._next_token()
+            if token == llm.token_eos():
+                break
+            draft.append(token)
+            if len(draft) < n_draft:
+                llm.eval([token])
+        return draft
+
+    def close(self):
+        self.llm.close()
+
+
+def check_vocab(target, draft):
+    """Raise ValueError unless both models tokenize identically (a draft's tokens must mean the same to the target)."""
+    sample = "I moved here last year, and honestly the winters are rougher than I expected.".encode("utf-8")
+    if target.n_vocab() != draft.n_vocab() or target.tokenize(sample) != draft.tokenize(sample):
+        raise ValueError(
+            f"Draft model {draft.model_path} does not share the vocabulary of {target.model_path} "
+            f"({draft.n_vocab()} vs {target.n_vocab()} tokens); use a draft from the same model family"
+        )
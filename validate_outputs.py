@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import os
+import re
+import argparse
+import pandas as pd
+
+from checkpoint_writer import failures_path, save_failures
+from constrained_decoding import FORBIDDEN_TERMS
+from generation_engine import MODELS, select_conditions
+from near_duplicates import DEFAULT_THRESHOLD, duplicate_mask
+
+MIN_WORDS = 50
+MAX_WORDS = 120
+
+# ================================
+# Checks
+# ================================
+# Each check takes the Generated Text column and the options dict and
+# returns a boolean Series that is True for failing rows. Register new ones
+# with @check("name").
+CHECKS = {}
+DEFAULT_CHECKS = ("error", "forbidden_terms", "word_count")
+
+
+def check(name):
+    def register(fn):
+        CHECKS[name] = fn
+        return fn
+    return register
+
+
+@check("error")
+def generation_error(text, options):
+    return text.str.strip().eq("") | text.str.startswith("[Error:")
+
+
+@check("forbidden_terms")
+def forbidden_terms(text, options):
+    pattern = r"\b(?:" + "|".join(re.escape(term) for term in options["forbidden_terms"]) + r")\b"
+    return text.str.contains(pattern, case=False, regex=True)
+
+
+@check("word_count")
+def word_count(text, options):
+    n_words = text.str.count(r"\S+")
+    return (n_words < options["min_words"]) | (n_words > options["max_words"])
+
+
+@check("hashtags")
+def hashtags(text, options):
+    return text.str.contains(r"(?<!\w)#\w", regex=True)
+
+
+@check("title")
+def title(text, options):
+    return text.str.match(r"\s*\**\s*title\s*:", case=False)
+
+
+@check("near_duplicates")
+def near_duplicates(text, options):
+    return pd.Series(duplicate_mask(text.tolist(), options["dedup_threshold"]), index=text.index)
+
+
+def validate(df, checks=DEFAULT_CHECKS, **options):
+    """Run the named checks over an output frame; returns one boolean column per check."""
+    options = dict({"forbidden_terms": FORBIDDEN_TERMS, "min_words": MIN_WORDS, "max_words": MAX_WORDS,
+                    "dedup_threshold": DEFAULT_THRESHOLD}, **options)
+    text = df["Generated Text"].fillna("").astype(str)
+    return pd.DataFrame({name: CHECKS[name](text, options) for name in checks}, index=df.index)
+
+
+def validate_output(path, checks=DEFAULT_CHECKS, **options):
+    """
+    Validate one generated CSV and write `<csv>.failures.csv` (TID and the
+    checks it failed), which generation_engine.py --regenerate picks up.
+    Returns the failures frame.
+    """
+    df = pd.read_csv(path, usecols=["TID", "Generated Text"], keep_default_na=False)
+    results = validate(df, checks, **options)
+    failed = results.any(axis=1)
+
+    failures = pd.DataFrame({
+        "TID": df.loc[failed, "TID"],
+        "failed_checks": [";".join(results.columns[row]) for row in results[failed].to_numpy()],
+    })
+    save_failures(path, failures)
+
+    counts = ", ".join(f"{name} {int(results[name].sum())}" for name in results.columns)
+    print(f"{path}: {int(failed.sum())}/{len(df)} rows failed ({counts}) -> {failures_path(path)}")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check generated comments and list the TIDs to regenerate."
+    )
+    parser.add_argument("--model", choices=sorted(MODELS), required=True)
+    parser.add_argument("--conditions", nargs="+", default=None)
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--checks", nargs="+", choices=sorted(CHECKS), default=list(DEFAULT_CHECKS))
+    parser.add_argument("--forbidden-terms", nargs="+", default=FORBIDDEN_TERMS)
+    parser.add_argument("--min-words", type=int, default=MIN_WORDS)
+    parser.add_argument("--max-words", type=int, default=MAX_WORDS)
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Similarity above which near_duplicates flags a row (all but the first of a cluster)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for cond in select_conditions(args.model, args.conditions):
+        path = os.path.join(args.output_dir, cond["output"])
+        if not os.path.exists(path):
+            if args.conditions:
+                print(f"No output found for {cond['name']} ({path})")
+            continue
+        validate_output(path, args.checks, forbidden_terms=args.forbidden_terms,
+                        min_words=args.min_words, max_words=args.max_words, dedup_threshold=args.dedup_threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import socket
+import getpass
+import tempfile
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"model_worker-{getpass.getuser()}.sock")
+
+
+class WorkerBackend:
+    """
+    Client for a model_worker.py process: the model stays loaded in the
+    worker and this side only sends prompts over its Unix socket, so a
+    script starts generating without importing llama.cpp weights again.
+
+    Messages are one JSON object per line. Prompts run one at a time, in
+    order, on the worker's copy of the model; generate() has the same
+    (entry, completion) interface as ServerBackend.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.model = None
+        self.model_path = None
+        self._sock = None
+        self._file = None
+
+    def _connect(self):
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError as e:
+                sock.close()
+                raise ConnectionError(f"No model worker at {self.socket_path} ({e}); "
+                                      f"start one with python3 model_worker.py") from e
+            self._sock = sock
+            self._file = sock.makefile("rwb")
+        return self._file
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = self._file = None
+
+    def call(self, op, **payload):
+        payload["op"] = op
+        stream = self._connect()
+        try:
+            stream.write(json.dumps(payload).encode("utf-8") + b"\n")
+            stream.flush()
+            line = stream.readline()
+        except OSError:
+            self.close()
+            raise
+        if not line:
+            self.close()
+            raise ConnectionResetError(f"Model worker at {self.socket_path} closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def load(self, model_size, model_path=None, n_ctx=None):
+        """
+        Load the model with `n_ctx` tokens of context (default: the model
+        entry's) in the worker unless it already holds it; returns its path.
+        """
+        loaded = self.call("load", model_size=model_size, model_path=model_path, n_ctx=n_ctx)
+        self.model = loaded["model"]
+        self.model_path = loaded["model_path"]
+        return self.model_path
+
+    def status(self):
+        return self.call("status")
+
+    def generate(self, entries, gen_config):
+        for entry in entries:
+            started = time.perf_counter()
+            try:
+                out = self.call("complete", model=self.model, prompt=entry["prompt"], gen_config=gen_config,
+                                seed=entry.get("seed"))
+            except (RuntimeError, OSError) as e:
+                out = {"error": str(e) or type(e).__name__}
+            out["latency_ms"] = (time.perf_counter() - started) * 1000.0
+            yield entry, out
+
+    def tokenize(self, text):
+        return self.call("tokenize", model=self.model, text=text)
+
+    def detokenize(self, tokens):
+        return self.call("detokenize", model=self.model, tokens=[int(t) for t in tokens])
+
+    def n_ctx(self):
+        return self.call("n_ctx", model=self.model)
+
+    def model_name(self):
+        return self.model_path